@@ -9,6 +9,7 @@ from fastapi.websockets import WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from twilio.rest import Client
 import websockets
+import requests
 from dotenv import load_dotenv
 import uvicorn
 import re
@@ -34,6 +35,11 @@ print(f"PHONE_NUMBER_FROM: {PHONE_NUMBER_FROM}")
 print(f"OPENAI_API_KEY: {OPENAI_API_KEY}")
 print(f"DOMAIN: {DOMAIN}")
 PORT = int(os.getenv("PORT", 6060))
+# Research backend that receives live transcript batches for the call node
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+TRANSCRIPT_FLUSH_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_SECONDS", 3))
+TRANSCRIPT_FLUSH_TOKENS = int(os.getenv("TRANSCRIPT_FLUSH_TOKENS", 40))
+CALL_AGENT_TOKEN = os.getenv("CALL_AGENT_TOKEN", "")  # must match the backend's CALL_AGENT_TOKEN
 SYSTEM_MESSAGE = (
     "You are an AI voice assistant to ask the user questions and gather information. You are talking to an expert on the topic of the call: {topic}. You will not ask the user clarifying questions, you will ask the user to answer the question directly."
 )
@@ -82,12 +88,71 @@ class CallRequest(BaseModel):
     phone_number: str
     topic: str
     max_duration: Optional[int] = 300  # default 5 minutes
+    node_id: Optional[str] = None  # research graph node that receives the transcript
 
 
 # Add a dictionary to store call summaries
 call_summaries = {}
 
 
+class TranscriptBatcher:
+    """
+    Buffers transcript text for one call and posts it to the research backend
+    in batches, either every TRANSCRIPT_FLUSH_SECONDS or once
+    TRANSCRIPT_FLUSH_TOKENS words are pending, instead of once per delta.
+    add() only buffers, so the audio relay never waits on the backend; the
+    posts are made by run(). The last post, flush(ended=True), tells the
+    backend the call is over.
+    """
+
+    def __init__(self, node_id: Optional[str]):
+        self.node_id = node_id
+        self.lines = []  # pending [role, text] pairs, same-role deltas merged
+        self.pending_tokens = 0
+        self.lock = asyncio.Lock()
+        self.full = asyncio.Event()  # TRANSCRIPT_FLUSH_TOKENS words are pending
+
+    def add(self, role: str, text: str):
+        if not self.node_id or not text:
+            return
+        if self.lines and self.lines[-1][0] == role:
+            self.lines[-1][1] += text
+        else:
+            self.lines.append([role, text])
+        self.pending_tokens += len(text.split())
+        if self.pending_tokens >= TRANSCRIPT_FLUSH_TOKENS:
+            self.full.set()
+
+    async def flush(self, ended: bool = False):
+        async with self.lock:
+            if not self.node_id or not (self.lines or ended):
+                return
+            lines, self.lines, self.pending_tokens = self.lines, [], 0
+            self.full.clear()
+            payload = {"lines": [{"role": role, "text": text} for role, text in lines], "ended": ended}
+            try:
+                response = await asyncio.to_thread(
+                    requests.post,
+                    f"{BACKEND_URL}/calls/{self.node_id}/transcript",
+                    json=payload,
+                    headers={"X-Call-Token": CALL_AGENT_TOKEN},
+                    timeout=5,
+                )
+                if response.status_code != 200:
+                    print(f"Transcript update rejected: {response.text}")
+            except Exception as e:
+                print(f"Error sending transcript update: {e}")
+
+    async def run(self):
+        """Flush once enough words are pending, or on a timer so quiet stretches of the call still get pushed."""
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), TRANSCRIPT_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Twilio Media Stream Server is running!"}
@@ -100,6 +165,7 @@ async def handle_media_stream(websocket: WebSocket):
     await websocket.accept()
 
     conversation_transcript = []
+    batcher = TranscriptBatcher(None)
 
     async with websockets.connect(
         "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview",
@@ -125,6 +191,8 @@ async def handle_media_stream(websocket: WebSocket):
                         await openai_ws.send(json.dumps(audio_append))
                     elif data["event"] == "start":
                         stream_sid = data["start"]["streamSid"]
+                        custom_parameters = data["start"].get("customParameters", {})
+                        batcher.node_id = custom_parameters.get("node_id")
                         print(f"Incoming stream has started {stream_sid}")
             except WebSocketDisconnect:
                 print("Client disconnected.")
@@ -162,6 +230,17 @@ async def handle_media_stream(websocket: WebSocket):
                         if "delta" in response and "text" in response["delta"]:
                             conversation_transcript.append(response["delta"]["text"])
                         print(f"Total transcript: {conversation_transcript}")
+                    # Live transcript for the call node: assistant speech arrives
+                    # as deltas, caller speech as one completed transcription per turn
+                    if response["type"] == "response.audio_transcript.delta":
+                        conversation_transcript.append(response.get("delta", ""))
+                        batcher.add("assistant", response.get("delta", ""))
+                    if (
+                        response["type"]
+                        == "conversation.item.input_audio_transcription.completed"
+                    ):
+                        conversation_transcript.append(response.get("transcript", ""))
+                        batcher.add("caller", response.get("transcript", ""))
                     # Handle end of call
                     if response["type"] == "session.done":
                         summary = await generate_summary(conversation_transcript)
@@ -171,7 +250,12 @@ async def handle_media_stream(websocket: WebSocket):
             except Exception as e:
                 print(f"Error in send_to_twilio: {e}")
 
-        await asyncio.gather(receive_from_twilio(), send_to_twilio())
+        flush_task = asyncio.create_task(batcher.run())
+        try:
+            await asyncio.gather(receive_from_twilio(), send_to_twilio())
+        finally:
+            flush_task.cancel()
+            await batcher.flush(ended=True)
 
 
 async def send_initial_conversation_item(openai_ws):
@@ -208,6 +292,7 @@ async def initialize_session(openai_ws):
             "instructions": SYSTEM_MESSAGE,
             "modalities": ["text", "audio"],
             "temperature": 0.8,
+            "input_audio_transcription": {"model": "whisper-1"},
         },
     }
     print("Sending session update:", json.dumps(session_update))
@@ -311,11 +396,18 @@ async def create_call(call_request: CallRequest):
         SYSTEM_MESSAGE = f"You are an AI voice assistant to ask the user questions and gather information about the topic of the call: {call_request.topic}"
         TOPIC = call_request.topic
 
+        # Pass the node id through the stream so transcript batches can be routed
+        stream_parameters = ""
+        if call_request.node_id:
+            stream_parameters = (
+                f'<Parameter name="node_id" value="{call_request.node_id}" />'
+            )
+
         outbound_twiml = (
             f'<?xml version="1.0" encoding="UTF-8"?>'
             f"<Response>"
             f"<Connect>"
-            f'<Stream url="wss://{DOMAIN}/media-stream" />'
+            f'<Stream url="wss://{DOMAIN}/media-stream">{stream_parameters}</Stream>'
             f"</Connect>"
             f'<Hangup timeout="{call_request.max_duration}"/>'
             f"</Response>"
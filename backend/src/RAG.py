@@ -1,7 +1,20 @@
 import os
-import voyageai
+import json
+import time
+import hashlib
+import io
+import queue
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Dict
 from dotenv import load_dotenv
+from embedding_cache import get_cache
+from embeddings import embedding_text
+from dedup import DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_INDEX_PATH, NearDuplicateIndex, minhash
+from vector_store import open_store
 from unstructured.partition.auto import partition
 from unstructured.partition.pdf import partition_pdf
 from unstructured.partition.html import partition_html
@@ -9,115 +22,785 @@ from unstructured.chunking.title import chunk_by_title
 
 load_dotenv()
 
+MANIFEST_PATH = "./rag_manifest.json"
+# "auto" picks fast or hi_res per page; "fast" or "hi_res" force one strategy
+PARTITION_STRATEGY = os.getenv("RAG_PARTITION_STRATEGY", "auto")
+# In auto mode, pages with less text-layer content than this (scanned pages)
+# or image pages with less than IMAGE_PAGE_MIN_CHARACTERS go through hi_res.
+# Counts are bytes of text-showing string operands, see page_text_bytes
+TEXT_LAYER_MIN_CHARACTERS = int(os.getenv("RAG_TEXT_LAYER_MIN_CHARACTERS", 100))
+IMAGE_PAGE_MIN_CHARACTERS = int(os.getenv("RAG_IMAGE_PAGE_MIN_CHARACTERS", 500))
+CHUNK_MAX_CHARACTERS = 500
+PARTITION_WORKERS = int(os.getenv("RAG_PARTITION_WORKERS", os.cpu_count() or 1))
+# Documents longer than this are split into page ranges across workers
+PAGES_PER_TASK = int(os.getenv("RAG_PAGES_PER_TASK", 20))
+# Embedding requests are capped by item count and by estimated tokens
+EMBED_BATCH_ITEMS = int(os.getenv("RAG_EMBED_BATCH_ITEMS", 128))
+EMBED_BATCH_TOKENS = int(os.getenv("RAG_EMBED_BATCH_TOKENS", 32000))
+EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", 4))
+INSERT_BATCH_SIZE = int(os.getenv("RAG_INSERT_BATCH_SIZE", 256))
+# Single-file ingestion (uploads) inserts small batches so chunks are searchable early
+FILE_INSERT_BATCH_SIZE = int(os.getenv("RAG_FILE_INSERT_BATCH_SIZE", 32))
+# "hybrid" fuses vector and BM25 keyword results; "vector" or "keyword" use one retriever
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+# Candidates each retriever contributes to the fusion, as a multiple of the limit
+FUSION_CANDIDATES_FACTOR = 4
+RRF_K = 60
 
-def setup_db():
-    # Import weaviate locally to avoid circular dependency issues
-    import weaviate
+# Anything that changes the chunks or vectors a file produces; a file whose
+# recorded params differ from these (plus the store's embedding provider) is
+# re-ingested even if its bytes match.
+INGEST_PARAMS = {
+    "strategy": PARTITION_STRATEGY,
+    "text_layer_min_characters": TEXT_LAYER_MIN_CHARACTERS,
+    "image_page_min_characters": IMAGE_PAGE_MIN_CHARACTERS,
+    "chunking": "by_title",
+    "max_characters": CHUNK_MAX_CHARACTERS,
+    "dedup_threshold": DEDUP_THRESHOLD if DEDUP_ENABLED else None,
+}
 
-    client = weaviate.connect_to_local()
-    collection_name = "demo"
 
-    # Attempt to delete the collection if it exists
-    try:
-        client.collections.delete(collection_name)
-    except Exception as e:
-        print(f"Could not delete collection (it might not exist yet): {e}")
+def setup_db(reset=False, embedding_provider=None, name="demo"):
+    """
+    Open the named collection ("demo" by default) on the vector store backend
+    selected by RAG_VECTOR_STORE ("weaviate" or the in-process "local"
+    store), embedding with the collection's provider (RAG_EMBEDDING_PROVIDER
+    when new).
+    """
+    return open_store(name, reset=reset, embedding_provider=embedding_provider)
+
+
+def load_manifest(path=MANIFEST_PATH) -> Dict:
+    """
+    Load the ingestion manifest, a {filename: entry} dict recording the size,
+    mtime, content hash, ingest params and chunk count of every ingested file.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write to a temp file first so a crash never leaves a truncated manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(file_path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plan_ingestion(dir, manifest, params=INGEST_PARAMS):
+    """
+    Compare the PDFs in dir against the manifest.
+    Returns (changed, removed, fingerprints): files to (re)ingest, manifest
+    entries whose file is gone, and the fingerprint of every file on disk.
+    Size and mtime are checked first so unchanged files are never re-hashed.
+    """
+    changed = []
+    fingerprints = {}
+    for filename in sorted(os.listdir(dir)):
+        if not filename.endswith(".pdf"):
+            continue
+        stat = os.stat(os.path.join(dir, filename))
+        entry = manifest.get(filename)
+        live = entry and not entry.get("deleted") and entry["params"] == params
+        if live and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            fingerprints[filename] = entry
+            continue
+        fingerprint = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(os.path.join(dir, filename)),
+            "params": params,
+        }
+        fingerprints[filename] = fingerprint
+        if not (live and entry["sha256"] == fingerprint["sha256"]):
+            changed.append(filename)
+    removed = [
+        filename
+        for filename, entry in manifest.items()
+        if filename not in fingerprints and not entry.get("deleted")
+    ]
+    return changed, removed, fingerprints
+
+
+def partition_tasks(dir, filenames=None, pages_per_task=PAGES_PER_TASK, strategy=PARTITION_STRATEGY):
+    """
+    Build the (file_path, first_page, last_page, strategy) work items for the
+    PDFs in dir, in sorted filename order. Short documents are a single item
+    covering every page (last_page None); long ones are split into page ranges.
+    """
+    from pypdf import PdfReader
 
-    # Create a new collection using a local import for Configure
+    tasks = []
+    for filename in sorted(os.listdir(dir)):
+        if filenames is not None and filename not in filenames:
+            continue
+        if not filename.endswith(".pdf"):
+            continue
+        file_path = os.path.join(dir, filename)
+        num_pages = len(PdfReader(file_path).pages)
+        if num_pages <= pages_per_task:
+            tasks.append((file_path, 1, None, strategy))
+            continue
+        for first_page in range(1, num_pages + 1, pages_per_task):
+            last_page = min(first_page + pages_per_task - 1, num_pages)
+            tasks.append((file_path, first_page, last_page, strategy))
+    return tasks
+
+
+TEXT_OBJECT_PATTERN = re.compile(rb"\bBT\b(.*?)\bET\b", re.S)
+PDF_STRING_PATTERN = re.compile(rb"\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>")
+
+
+def page_text_bytes(page) -> int:
+    """
+    Estimate how much text a pypdf page's text layer holds by summing the
+    string operands inside its BT/ET text objects. Unlike extract_text this
+    never decodes fonts (well under a millisecond per page rather than most
+    of a second); it over-counts multi-byte fonts, which only matters near
+    the thresholds.
+    """
+    contents = page.get("/Contents")
+    if contents is None:
+        return 0
+    contents = contents.get_object()
+    if hasattr(contents, "get_data"):
+        data = contents.get_data()
+    else:
+        data = b"\n".join(stream.get_object().get_data() for stream in contents)
+    num_bytes = 0
+    for text_object in TEXT_OBJECT_PATTERN.findall(data):
+        for string in PDF_STRING_PATTERN.findall(text_object):
+            if string[:1] == b"(":
+                num_bytes += len(string) - 2
+            else:
+                num_bytes += len(b"".join(string[1:-1].split())) // 2
+    return num_bytes
+
+
+def page_image_count(page) -> int:
+    """Number of image XObjects drawn directly on a pypdf page (not decoded)."""
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return 0
+    return sum(
+        1 for xobject in xobjects.get_object().values()
+        if xobject.get_object().get("/Subtype") == "/Image"
+    )
+
+
+def page_strategy(page) -> str:
+    """
+    Cheap per-page check run before layout inference: pages with a usable
+    text layer are partitioned with "fast", scanned and image-heavy pages
+    with "hi_res".
+    """
     try:
-        from weaviate.classes.config import Configure
+        num_characters = page_text_bytes(page)
+    except Exception:
+        return "hi_res"
+    if num_characters < TEXT_LAYER_MIN_CHARACTERS:
+        return "hi_res"
+    if num_characters < IMAGE_PAGE_MIN_CHARACTERS and page_image_count(page):
+        return "hi_res"
+    return "fast"
+
+
+def strategy_runs(pages, first_page, last_page):
+    """Split pages first_page..last_page into (first, last, strategy) runs of consecutive pages."""
+    runs = []
+    for page_number in range(first_page, last_page + 1):
+        strategy = page_strategy(pages[page_number - 1])
+        if runs and runs[-1][2] == strategy:
+            runs[-1][1] = page_number
+        else:
+            runs.append([page_number, page_number, strategy])
+    return [tuple(run) for run in runs]
 
-        client.collections.create(
-            name=collection_name, vectorizer_config=Configure.Vectorizer.none()
+
+def partition_pages(reader, file_path, first_page, last_page, strategy):
+    """Partition pages first_page..last_page of an open PDF with one strategy."""
+    if first_page == 1 and last_page == len(reader.pages):
+        return partition_pdf(
+            filename=file_path,
+            strategy=strategy,
+            extract_image_block_types=[],
+            extract_image_block_to_payload=False,
         )
-        collection = client.collections.get(collection_name)
-    except Exception as e:
-        print(f"Error creating collection: {e}")
-        collection = client.collections.get(collection_name)
 
-    return client, collection
+    from pypdf import PdfWriter
+
+    # Copy the page range into an in-memory PDF and keep the original file's
+    # name, mtime and page numbers on the resulting elements
+    writer = PdfWriter()
+    for page in reader.pages[first_page - 1 : last_page]:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return partition_pdf(
+        file=buffer,
+        metadata_filename=os.path.basename(file_path),
+        metadata_last_modified=datetime.fromtimestamp(
+            os.path.getmtime(file_path)
+        ).isoformat(),
+        starting_page_number=first_page,
+        strategy=strategy,
+        extract_image_block_types=[],
+        extract_image_block_to_payload=False,
+    )
 
 
-def load_pdfs(dir) -> List[Dict]:
+def partition_range(file_path, first_page=1, last_page=None, strategy=PARTITION_STRATEGY):
+    """
+    Partition one PDF, or only pages first_page..last_page of it (1-based,
+    inclusive). With strategy "auto" each run of pages gets the strategy
+    page_strategy picks for it. Every element records the strategy that
+    produced it in metadata.partition_strategy. Runs inside worker
+    processes, so it must stay module-level.
     """
-    Load all PDFs from the directory using Unstructured.
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    last_page = last_page or len(reader.pages)
+    if strategy == "auto":
+        runs = strategy_runs(reader.pages, first_page, last_page)
+    else:
+        runs = [(first_page, last_page, strategy)]
+    elements = []
+    for run_first, run_last, run_strategy in runs:
+        run_elements = partition_pages(reader, file_path, run_first, run_last, run_strategy)
+        for element in run_elements:
+            element.metadata.partition_strategy = run_strategy
+        elements.extend(run_elements)
+    return elements
+
+
+def _partition_task(task):
+    return partition_range(*task)
+
+
+def iter_partitioned(dir, filenames=None, workers=PARTITION_WORKERS, strategy=PARTITION_STRATEGY):
+    """
+    Partition PDFs across a pool of worker processes.
+    Yields (filename, elements) per file in sorted filename order, with each
+    file's page ranges merged back in page order, as soon as that file and
+    every file before it are done.
+    """
+    tasks = partition_tasks(dir, filenames, strategy=strategy)
+    if not tasks:
+        return
+
+    def grouped(results):
+        current, elements = None, []
+        for (file_path, *_), task_elements in zip(tasks, results):
+            filename = os.path.basename(file_path)
+            if current is not None and filename != current:
+                yield current, elements
+                elements = []
+            current = filename
+            elements.extend(task_elements)
+        yield current, elements
+
+    if workers <= 1:
+        yield from grouped(map(_partition_task, tasks))
+        return
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from grouped(ordered_map(pool, _partition_task, tasks, 2 * workers))
+
+
+def ordered_map(pool, fn, iterable, window):
+    """
+    Like pool.map, but keeps at most window calls in flight so results cannot
+    pile up ahead of a slow consumer. Results come back in submission order.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+_STAGE_DONE = object()
+
+
+def bounded(iterable, maxsize):
+    """
+    Run iterable in a background thread, buffering at most maxsize items
+    ahead of the consumer. Chaining these gives each pipeline stage its own
+    thread while keeping memory bounded by the queue sizes.
+    """
+    buffer = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except Exception as e:
+            put(_StageError(e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        # Unblock the producer if the consumer stops early
+        stopped.set()
+
+
+def load_pdfs(dir, filenames=None, workers=PARTITION_WORKERS, strategy=PARTITION_STRATEGY) -> List[Dict]:
+    """
+    Load PDFs from the directory using Unstructured, optionally restricted
+    to the given filenames.
     Returns list of document elements.
     """
     documents = []
-    for filename in os.listdir(dir):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(dir, filename)
-            elements = partition_pdf(
-                filename=file_path,
-                strategy="hi_res",
-                extract_image_block_types=[],
-                extract_image_block_to_payload=False,
-            )
-            documents.extend(elements)
+    for _, elements in iter_partitioned(dir, filenames, workers, strategy):
+        documents.extend(elements)
     return documents
 
 
+def chunk_records(elements):
+    """
+    Chunk one document's elements and yield (embedding_object, metadata) per chunk.
+    """
+    # Chunking only keeps standard metadata fields, so the partition strategy
+    # is carried over through the chunk's (first) page number
+    page_strategies = {
+        element.metadata.page_number: getattr(element.metadata, "partition_strategy", None)
+        for element in elements
+    }
+    for chunk in chunk_by_title(elements, max_characters=CHUNK_MAX_CHARACTERS):
+        chunk_dict = chunk.to_dict()
+        metadata = chunk_dict["metadata"]
+        metadata_dict = {
+            "text": chunk_dict["text"],
+            "filename": metadata.get("filename"),
+            "page_number": metadata.get("page_number"),
+            "last_modified": metadata.get("last_modified"),
+            "languages": metadata.get("languages"),
+            "filetype": metadata.get("filetype"),
+            "partition_strategy": page_strategies.get(metadata.get("page_number")),
+        }
+        yield [chunk_dict["text"]], metadata_dict
+
+
 def preprocess_chunks(elements):
     embedding_objects = []
     embedding_metadatas = []
-    chunks = chunk_by_title(elements)
-
-    for chunk in chunks:
-        embedding_object = []
-        metedata_dict = {
-            "text": chunk.to_dict()["text"],
-            "filename": chunk.to_dict()["metadata"]["filename"],
-            "page_number": chunk.to_dict()["metadata"]["page_number"],
-            "last_modified": chunk.to_dict()["metadata"]["last_modified"],
-            "languages": chunk.to_dict()["metadata"]["languages"],
-            "filetype": chunk.to_dict()["metadata"]["filetype"],
-        }
-        embedding_object.append(chunk.to_dict()["text"])
-
+    for embedding_object, metadata_dict in chunk_records(elements):
         embedding_objects.append(embedding_object)
-        embedding_metadatas.append(metedata_dict)
+        embedding_metadatas.append(metadata_dict)
     return embedding_objects, embedding_metadatas
 
 
-def embed_data(embedding_objects, embedding_metadatas, collection):
-    vo = voyageai.Client()
-    result = vo.multimodal_embed(
-        embedding_objects, model="voyage-multimodal-3", truncation=False
-    )
-    with collection.batch.dynamic() as batch:
-        for i, data_row in enumerate(embedding_objects):
-            batch.add_object(
-                properties=embedding_metadatas[i], vector=result.embeddings[i]
+def iter_chunks(files):
+    """
+    Pipeline stage: turn (filename, elements) into a stream of
+    ("chunk", filename, (embedding_object, metadata)) items, followed by a
+    ("file", filename, num_chunks) marker once the file's chunks are out.
+    """
+    for filename, elements in files:
+        num_chunks = 0
+        for record in chunk_records(elements):
+            num_chunks += 1
+            yield "chunk", filename, record
+        yield "file", filename, num_chunks
+
+
+def iter_deduplicated(items, index, report):
+    """
+    Pipeline stage: drop chunks that are near-duplicates of a chunk already
+    in the index (from this run or an earlier one) and index the rest. File
+    markers are rewritten to carry the number of chunks kept, and
+    report[filename] records the total, the duplicates removed and the files
+    holding the copies that were kept.
+    """
+    for kind, filename, payload in items:
+        if kind == "file":
+            file_report = report.setdefault(
+                filename, {"chunks": 0, "duplicates": 0, "duplicates_of": set()}
             )
+            yield kind, filename, file_report["chunks"] - file_report["duplicates"]
+            continue
+        file_report = report.setdefault(
+            filename, {"chunks": 0, "duplicates": 0, "duplicates_of": set()}
+        )
+        file_report["chunks"] += 1
+        signature = minhash(embedding_text(payload[0]))
+        match = index.find(signature)
+        if match is not None:
+            file_report["duplicates"] += 1
+            file_report["duplicates_of"].add(index.filenames[match[0]])
+            continue
+        index.add(filename, signature)
+        yield kind, filename, payload
 
 
-def query(question, collection):
-    vo = voyageai.Client()
-    query_embedding = vo.multimodal_embed(
-        [[question]], model="voyage-multimodal-3", truncation=False
-    )
-    response = collection.query.near_vector(
-        near_vector=query_embedding.embeddings[0],
-        limit=5,
-        return_metadata=MetadataQuery(distance=True),
-    )
-    for o in response.objects:
-        print(o.properties["text"])
-        print(o.metadata.distance)
+def estimate_tokens(embedding_object) -> int:
+    # Roughly four characters per token for English text
+    return sum(len(part) for part in embedding_object if isinstance(part, str)) // 4 + 1
+
+
+def cached_embed(embedder, embedding_objects, kind="document"):
+    """
+    Embed a batch through the persistent embedding cache: texts seen before
+    are read from the cache and only the misses are sent to the provider.
+    """
+    cache = get_cache(embedder.name)
+    texts = [embedding_text(embedding_object) for embedding_object in embedding_objects]
+    vectors = cache.get_many(texts)
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+    if misses:
+        new_vectors = embedder.embed([embedding_objects[i] for i in misses], kind)
+        cache.put_many([texts[i] for i in misses], new_vectors, kind)
+        for i, vector in zip(misses, new_vectors):
+            vectors[i] = vector
+    return vectors
+
+
+def iter_embedded(items, embedder, concurrency=EMBED_CONCURRENCY):
+    """
+    Pipeline stage: group chunk items into batches of at most EMBED_BATCH_ITEMS
+    items and EMBED_BATCH_TOKENS estimated tokens, embed up to concurrency
+    batches at once, and yield the items back in order with the vector
+    appended to each chunk's payload. File markers pass through in place.
+    """
+
+    def batches():
+        batch, num_items, num_tokens = [], 0, 0
+        for item in items:
+            if item[0] == "chunk":
+                tokens = estimate_tokens(item[2][0])
+                if num_items and (
+                    num_items >= EMBED_BATCH_ITEMS
+                    or num_tokens + tokens > EMBED_BATCH_TOKENS
+                ):
+                    yield batch
+                    batch, num_items, num_tokens = [], 0, 0
+                num_items += 1
+                num_tokens += tokens
+            batch.append(item)
+        if batch:
+            yield batch
+
+    def embed_batch(batch):
+        objects = [payload[0] for kind, _, payload in batch if kind == "chunk"]
+        vectors = iter(cached_embed(embedder, objects) if objects else [])
+        return [
+            (kind, filename, payload + (next(vectors),) if kind == "chunk" else payload)
+            for kind, filename, payload in batch
+        ]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for embedded_batch in ordered_map(pool, embed_batch, batches(), concurrency):
+            yield from embedded_batch
+
+
+def insert_embedded(items, store, on_file_done=None, batch_size=INSERT_BATCH_SIZE):
+    """
+    Pipeline stage: insert embedded chunks in batches of batch_size. Pending
+    chunks are flushed at every file marker before on_file_done(filename,
+    num_chunks) runs, so a file is only reported once all its chunks are stored.
+    """
+    properties, vectors = [], []
+
+    def flush():
+        if properties:
+            store.add(properties, vectors)
+            properties.clear()
+            vectors.clear()
+
+    for kind, filename, payload in items:
+        if kind == "chunk":
+            _, metadata, vector = payload
+            properties.append(metadata)
+            vectors.append(vector)
+            if len(properties) >= batch_size:
+                flush()
+        else:
+            flush()
+            if on_file_done:
+                on_file_done(filename, payload)
+    flush()
+
+
+def run_pipeline(dir, filenames, store, on_file_done=None, dedup_index=None, dedup_report=None):
+    """
+    Streaming partition -> chunk -> dedup -> embed -> insert ingestion. Each
+    stage runs in its own thread behind a bounded queue, so peak memory
+    depends on the queue and batch sizes rather than on the size of the
+    corpus. Without a dedup_index every chunk is embedded.
+    """
+    files = bounded(iter_partitioned(dir, filenames), 1)
+    chunks = iter_chunks(files)
+    if dedup_index is not None:
+        chunks = iter_deduplicated(
+            chunks, dedup_index, dedup_report if dedup_report is not None else {}
+        )
+    chunks = bounded(chunks, EMBED_BATCH_ITEMS)
+    embedded = bounded(iter_embedded(chunks, store.embedder), INSERT_BATCH_SIZE)
+    insert_embedded(embedded, store, on_file_done)
+
+
+def embed_data(embedding_objects, embedding_metadatas, store):
+    items = [
+        ("chunk", metadata["filename"], (embedding_object, metadata))
+        for embedding_object, metadata in zip(embedding_objects, embedding_metadatas)
+    ]
+    insert_embedded(iter_embedded(items, store.embedder), store)
+
+
+_retrieval_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def vector_hits(question, store, limit, filename=None, page_number=None):
+    query_embedding = cached_embed(store.embedder, [[question]], kind="query")[0]
+    return store.query(query_embedding, limit, filename=filename, page_number=page_number)
+
+
+def reciprocal_rank_fusion(result_lists, limit, k=RRF_K):
+    """
+    Merge ranked hit lists by summing 1 / (k + rank) per hit id. Each fused
+    hit keeps the fields reported by every list it appeared in.
+    """
+    scores, fused = {}, {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, 1):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (k + rank)
+            fused.setdefault(hit["id"], {}).update(hit)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [dict(fused[hit_id], rrf_score=scores[hit_id]) for hit_id in ranked]
+
+
+def retrieve(question, store, limit=5, filename=None, page_number=None, mode=RETRIEVAL_MODE):
+    """
+    Return the top-limit chunks for the question as ranked hits with their
+    text, source file, page and cosine distance (None for chunks only the
+    keyword retriever found).
+
+    In hybrid mode the vector and BM25 retrievers run concurrently, each
+    fetching a few times more candidates than needed, and their rankings
+    are merged with reciprocal rank fusion.
+    """
+    if mode == "vector":
+        hits = vector_hits(question, store, limit, filename, page_number)
+    elif mode == "keyword":
+        hits = store.keyword_query(question, limit, filename=filename, page_number=page_number)
+    elif mode == "hybrid":
+        candidates = max(limit * FUSION_CANDIDATES_FACTOR, 20)
+        vector_future = _retrieval_pool.submit(
+            vector_hits, question, store, candidates, filename, page_number
+        )
+        keyword_future = _retrieval_pool.submit(
+            store.keyword_query, question, candidates, filename, page_number
+        )
+        hits = reciprocal_rank_fusion([vector_future.result(), keyword_future.result()], limit)
+    else:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    return [
+        {
+            "rank": rank,
+            "text": hit["properties"]["text"],
+            "filename": hit["properties"].get("filename"),
+            "page_number": hit["properties"].get("page_number"),
+            "distance": hit.get("distance"),
+        }
+        for rank, hit in enumerate(hits, 1)
+    ]
+
+
+def query(question, store, limit=5, filename=None, page_number=None, mode=RETRIEVAL_MODE):
+    hits = retrieve(question, store, limit, filename=filename, page_number=page_number, mode=mode)
+    for hit in hits:
+        print(hit["text"])
+        print(hit["distance"])
+    return hits
+
+
+def partition_file(path):
+    """Partition one file of any supported type; PDFs use the per-page strategy."""
+    if path.lower().endswith(".pdf"):
+        return partition_range(path)
+    return partition(filename=path)
+
+
+def ingest_file(path, store, on_progress=None, metadata=None, batch_size=FILE_INSERT_BATCH_SIZE):
+    """
+    Index a single file outside the manifest-tracked corpus (e.g. an upload).
+    Chunks are embedded and inserted in batches of batch_size, so the first
+    ones are searchable while the rest are still being embedded, and
+    on_progress(done, total) runs after every batch. metadata is merged into
+    each chunk's properties. Returns the number of chunks indexed.
+    """
+    records = list(chunk_records(partition_file(path)))
+    if on_progress:
+        on_progress(0, len(records))
+    try:
+        for start in range(0, len(records), batch_size):
+            batch = records[start : start + batch_size]
+            vectors = cached_embed(store.embedder, [embedding_object for embedding_object, _ in batch])
+            store.add([dict(properties, **(metadata or {})) for _, properties in batch], vectors)
+            if on_progress:
+                on_progress(start + len(batch), len(records))
+    finally:
+        get_cache(store.embedder.name).flush()
+        store.flush()
+    return len(records)
+
+
+def dependent_files(manifest, filenames):
+    """
+    Files whose near-duplicate chunks were dropped in favour of copies in
+    filenames, directly or transitively. They must be re-ingested when those
+    copies go away, or the shared text would vanish from the store.
+    """
+    affected = set(filenames)
+    dependents = set()
+    while True:
+        new = {
+            filename
+            for filename, entry in manifest.items()
+            if not entry.get("deleted")
+            and filename not in affected
+            and affected.intersection(entry.get("duplicates_of", ()))
+        }
+        if not new:
+            return dependents
+        dependents |= new
+        affected |= new
+
+
+def print_dedup_report(report):
+    total = sum(file_report["chunks"] for file_report in report.values())
+    removed = sum(file_report["duplicates"] for file_report in report.values())
+    if not total:
+        return
+    print(f"[RAG] Dedup removed {removed} of {total} chunks ({removed / total:.1%})")
+    for filename, file_report in sorted(
+        report.items(), key=lambda item: item[1]["duplicates"], reverse=True
+    ):
+        if file_report["duplicates"]:
+            print(f"[RAG]   {filename}: {file_report['duplicates']}/{file_report['chunks']} "
+                  f"duplicates of {', '.join(sorted(file_report['duplicates_of']))}")
+
+
+def ingest_dir(dir, store, manifest_path=MANIFEST_PATH, dedup_index_path=DEDUP_INDEX_PATH):
+    """
+    Incrementally sync the vector store with the PDFs in dir: unchanged files
+    are skipped, changed files have their chunks replaced, and files that
+    disappeared have their chunks deleted and are tombstoned in the manifest.
+    Near-duplicate chunks are dropped across the whole corpus unless
+    RAG_DEDUP=0.
+    """
+    manifest = load_manifest(manifest_path)
+    dedup_index = NearDuplicateIndex(dedup_index_path).load() if DEDUP_ENABLED else None
+    # A manifest describing chunks the store no longer holds (e.g. a fresh
+    # Weaviate instance or a different backend) is stale, so start over from scratch
+    if manifest and not store.count():
+        manifest = {}
+    if dedup_index is not None and not manifest:
+        dedup_index.clear()
+
+    params = dict(INGEST_PARAMS, embedding_model=store.embedder.name)
+    changed, removed, fingerprints = plan_ingestion(dir, manifest, params)
+    dependents = dependent_files(manifest, removed + changed) - set(removed)
+    changed += sorted(dependents - set(changed))
+    print(f"[RAG] {len(changed)} changed, {len(removed)} removed, "
+          f"{len(fingerprints) - len(changed)} unchanged")
+
+    # Drop changed files from the manifest before touching their chunks, so an
+    # interrupted run re-ingests them instead of trusting a partial insert
+    for filename in removed + changed:
+        if filename in manifest and not manifest[filename].get("deleted"):
+            manifest[filename].update({"deleted": True, "chunks": 0, "deleted_at": time.time()})
+    save_manifest(manifest, manifest_path)
+    for filename in removed + changed:
+        store.delete_file(filename)
+    if dedup_index is not None:
+        dedup_index.remove_files(removed + changed)
+
+    dedup_report = {}
+
+    def on_file_done(filename, num_chunks):
+        manifest[filename] = dict(
+            fingerprints[filename], chunks=num_chunks, ingested_at=time.time()
+        )
+        if filename in dedup_report:
+            manifest[filename].update(
+                duplicates=dedup_report[filename]["duplicates"],
+                duplicates_of=sorted(dedup_report[filename]["duplicates_of"]),
+            )
+        # Persist after every file so an interrupted run keeps its progress
+        save_manifest(manifest, manifest_path)
+
+    if changed:
+        cache = get_cache(store.embedder.name)
+        try:
+            run_pipeline(dir, changed, store, on_file_done, dedup_index, dedup_report)
+        finally:
+            cache.flush()
+            if dedup_index is not None:
+                dedup_index.save()
+        print(f"[RAG] Embedding cache: {cache.stats()}")
+        print_dedup_report(dedup_report)
+    elif dedup_index is not None and removed:
+        dedup_index.save()
+
+    # Pick up refreshed mtimes of files whose content hash was unchanged
+    for filename, fingerprint in fingerprints.items():
+        if filename not in changed:
+            manifest[filename].update(
+                size=fingerprint["size"], mtime_ns=fingerprint["mtime_ns"]
+            )
+    save_manifest(manifest, manifest_path)
+    store.flush()
+    return manifest
 
 
 def init_rag():
-    client, collection = setup_db()
-    elements = load_pdfs("./pdfs")
-    embedding_objects, embedding_metadatas = preprocess_chunks(elements)
-    embed_data(embedding_objects, embedding_metadatas, collection)
-    return client, collection
+    store = setup_db()
+    ingest_dir("./pdfs", store)
+    return store
 
 
 if __name__ == "__main__":
-    client, collection = setup_db()
-    elements = load_pdfs("./pdfs")
-    embedding_objects, embedding_metadatas = preprocess_chunks(elements)
-    embed_data(embedding_objects, embedding_metadatas, collection)
-    query("Argentina", collection)
+    store = setup_db()
+    ingest_dir("./pdfs", store)
+    query("Argentina", store)
     breakpoint()
@@ -0,0 +1,153 @@
+import os
+from array import array
+
+import numpy as np
+
+from quantization import KMEANS_MAX_SAMPLES, kmeans, nearest_centroids
+
+ANN_INDEX = os.getenv("RAG_ANN_INDEX", "none")  # "none" or "ivf"
+IVF_LISTS = int(os.getenv("RAG_IVF_LISTS", 0))  # 0 picks ~4*sqrt(rows) at training time
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", 8))
+IVF_TRAIN_ROWS = int(os.getenv("RAG_IVF_TRAIN_ROWS", 10000))
+# Retrain the centroids once the store has grown this many times past the training size
+IVF_RETRAIN_GROWTH = 4
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the rows of a LocalStore.
+
+    k-means centroids partition the vectors into lists; a query scores only
+    the rows in the nprobe lists whose centroids are closest to it. Rows are
+    assigned as they are added, so the index grows with streaming ingestion.
+    Centroids are saved in ivf.npz and each row's list id in the
+    memory-mapped ivf_lists.i32, so reloading rebuilds the lists with one
+    argsort instead of reassigning every vector.
+
+    Training is split so the slow part runs without the store's lock:
+    train() computes new centroids and lists from the rows so far without
+    touching the index, and publish(), under the lock, assigns the rows
+    added meanwhile and installs the result. Centroids and lists are held
+    together in state and replaced by one assignment, so a query never
+    pairs new centroids with old lists.
+    """
+
+    def __init__(self, dir, nlist=IVF_LISTS, nprobe=IVF_NPROBE):
+        self.centroids_path = os.path.join(dir, "ivf.npz")
+        self.assignments_path = os.path.join(dir, "ivf_lists.i32")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.state = None  # (centroids, lists: list id -> array("i") of row ids)
+        self.trained_rows = 0
+        self._assignments = None
+        if os.path.exists(self.centroids_path):
+            with np.load(self.centroids_path) as saved:
+                self.state = (saved["centroids"], [])
+                self.trained_rows = int(saved["trained_rows"])
+
+    @property
+    def trained(self):
+        return self.state is not None
+
+    @property
+    def centroids(self):
+        return self.state[0] if self.state is not None else None
+
+    def resize(self, capacity):
+        if self._assignments is not None:
+            self._assignments.flush()
+        with open(self.assignments_path, "ab") as f:
+            f.truncate(capacity * 4)
+        self._assignments = np.memmap(
+            self.assignments_path, dtype=np.int32, mode="r+", shape=(capacity,)
+        )
+
+    def load(self, num_rows):
+        """Rebuild the in-memory lists from the saved assignments of rows < num_rows."""
+        if not self.trained:
+            return
+        centroids = self.state[0]
+        self.state = (centroids, _lists(np.asarray(self._assignments[:num_rows]), len(centroids)))
+
+    def train(self, vectors, num_rows, sample_rows, seed=0):
+        """
+        Train centroids on sample_rows (a row id array into vectors) and
+        assign every row below num_rows. Returns (centroids, assignments,
+        lists, trained_rows) for publish(); the index itself is unchanged.
+        """
+        trained_rows = len(sample_rows)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(trained_rows)))
+        if len(sample_rows) > KMEANS_MAX_SAMPLES:
+            # Read only the sampled rows from the memmap, not every live row
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(sample_rows, KMEANS_MAX_SAMPLES, replace=False))
+        centroids = kmeans(vectors[sample_rows], nlist)
+        assignments = np.empty(num_rows, dtype=np.int32)
+        for start in range(0, num_rows, 65536):
+            end = min(start + 65536, num_rows)
+            assignments[start:end] = nearest_centroids(np.asarray(vectors[start:end], dtype=np.float32), centroids)
+        return centroids, assignments, _lists(assignments, len(centroids)), trained_rows
+
+    def publish(self, trained, vectors, num_rows):
+        """
+        Install the result of train(), assigning the rows it didn't cover
+        (those below num_rows added since). Call with the store's lock held.
+        """
+        centroids, assignments, lists, trained_rows = trained
+        start = len(assignments)
+        if num_rows > start:
+            added = nearest_centroids(np.asarray(vectors[start:num_rows], dtype=np.float32), centroids)
+            for row, list_id in enumerate(added.tolist(), start):
+                lists[list_id].append(row)
+            assignments = np.concatenate([assignments, added])
+        self._assignments[:num_rows] = assignments
+        self._assignments.flush()
+        np.savez(self.centroids_path, centroids=centroids, trained_rows=trained_rows)
+        self.trained_rows = trained_rows
+        self.state = (centroids, lists)
+
+    def add(self, start, vectors):
+        centroids, lists = self.state
+        assignments = nearest_centroids(np.asarray(vectors, dtype=np.float32), centroids)
+        self._assignments[start : start + len(assignments)] = assignments
+        for row, list_id in enumerate(assignments.tolist(), start):
+            lists[list_id].append(row)
+
+    def candidates(self, vector, nprobe=None):
+        """Sorted row ids of the nprobe lists nearest to vector."""
+        centroids, lists = self.state
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        distances = (centroids**2).sum(axis=1) - 2 * centroids @ vector
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        # tobytes() copies each list under the GIL, so a concurrent add can't
+        # hit an array that is still exporting its buffer
+        rows = np.concatenate(
+            [np.frombuffer(lists[i].tobytes(), dtype=np.int32) for i in probed]
+            or [np.zeros(0, dtype=np.int32)]
+        )
+        rows.sort()
+        return rows
+
+    def compact(self, keep, capacity, path):
+        """Write the list ids of rows keep, renumbered from 0, to path, sized for capacity rows."""
+        assignments = np.memmap(path, dtype=np.int32, mode="w+", shape=(capacity,))
+        assignments[: len(keep)] = self._assignments[keep]
+        assignments.flush()
+        del assignments
+
+    def reopen(self, capacity, num_rows):
+        """Switch to the assignments file compact() wrote, once it has been moved into place."""
+        self._assignments = None
+        self.resize(capacity)
+        self.load(num_rows)
+
+    def flush(self):
+        if self._assignments is not None:
+            self._assignments.flush()
+
+
+def _lists(assignments, nlist):
+    """Row ids grouped by list id, from each row's list id."""
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+    return [array("i", order[bounds[i] : bounds[i + 1]].astype(np.int32).tobytes()) for i in range(nlist)]
@@ -0,0 +1,87 @@
+"""
+Benchmark the IVF approximate index against exact search in the local store.
+
+By default the corpus is synthetic clustered unit vectors, since the bundled
+PDFs only produce a few hundred chunks; pass --store demo to use the chunks
+ingested into the local store instead. Reports build and reload time, and
+query latency and recall@k for each nprobe setting.
+
+Run from backend/src:
+    python -m benchmarks.ann --rows 200000 --dim 256 --nprobe 1 4 8 16 32
+"""
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+import ann
+import vector_store
+from vector_store import LocalStore
+
+
+def synthetic(rows, dim, clusters=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)]
+    vectors += 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors
+
+
+def build(name, dir, properties, vectors, **kwargs):
+    store = LocalStore(name, dir=dir, **kwargs)
+    for start in range(0, len(vectors), 10000):
+        store.add(properties[start : start + 10000], vectors[start : start + 10000])
+    return store
+
+
+def search(store, queries, k, **kwargs):
+    start = time.perf_counter()
+    results = [[hit["properties"]["text"] for hit in store.query(q, k, **kwargs)] for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF index benchmark")
+    parser.add_argument("--store", default=None)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--quantization", default="none")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.store:
+        _, vectors = LocalStore(args.store, quantization="none", ann="none").live_chunks()
+        ann.IVF_TRAIN_ROWS = vector_store.IVF_TRAIN_ROWS = 1
+        vector_store.QUANTIZATION_TRAIN_ROWS = 1
+    else:
+        vectors = synthetic(args.rows, args.dim)
+    queries = vectors[rng.choice(len(vectors), args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    properties = [{"text": str(i), "filename": "bench.pdf", "page_number": 1} for i in range(len(vectors))]
+    print(f"{len(vectors)} vectors, dim={vectors.shape[1]}, {len(queries)} queries, "
+          f"k={args.k}, quantization={args.quantization}")
+
+    with tempfile.TemporaryDirectory() as dir:
+        exact = build("exact", dir, properties, vectors, quantization="none", ann="none")
+        truth, exact_latency = search(exact, queries, args.k)
+        print(f"exact scan: {exact_latency * 1000:.2f} ms/query")
+
+        start = time.perf_counter()
+        store = build("ivf", dir, properties, vectors, quantization=args.quantization, ann="ivf")
+        store.wait_for_index()
+        print(f"ivf build: {time.perf_counter() - start:.2f}s, "
+              f"{len(store.index.centroids)} lists")
+        store.close()
+        start = time.perf_counter()
+        store = LocalStore("ivf", dir=dir, quantization=args.quantization, ann="ivf")
+        print(f"ivf reload: {time.perf_counter() - start:.2f}s")
+
+        print(f"{'nprobe':>6} {'ms/query':>9} {'speedup':>8} {'recall@' + str(args.k):>10}")
+        for nprobe in args.nprobe:
+            results, latency = search(store, queries, args.k, nprobe=nprobe)
+            recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])
+            print(f"{nprobe:>6} {latency * 1000:>9.2f} {exact_latency / latency:>7.1f}x {recall:>10.3f}")
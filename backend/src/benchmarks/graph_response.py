@@ -0,0 +1,90 @@
+"""
+/start latency on synthetic graphs: the cached-fragment response against
+the previous path, which re-validated every node and serialized the whole
+graph through response_model=ChatMessageOut. Cold is the first request
+after building the graph (every fragment serialized), warm the requests
+after it; "changed" touches --changed nodes before each request.
+
+Importing routes creates the OpenAI client, so OPENAI_API_KEY must be set
+(any value). Run from backend/src:
+    python -m benchmarks.graph_response --nodes 10000 100000
+"""
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes
+import schemas
+from graph import Graph
+from utils import create_node, update_node_children, update_node_content
+
+CONTENT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+
+
+def build_graph(num_nodes):
+    graph = Graph()
+    root = create_node(graph, "Root", "root", CONTENT, "init", datetime.now())
+    for i in range(num_nodes - 1):
+        parent = graph[i // 4].id if i else root
+        child = create_node(graph, f"Node {i}", "text", CONTENT, "mode_ii", datetime.now())
+        update_node_children(graph, parent, child)
+    return graph
+
+
+def legacy_start():
+    chat_history = [schemas.ChatMessage.model_validate(msg) for msg in routes.chat_messages]
+    nodes_dict = {node.id: schemas.NodeV2.model_validate(node) for node in routes.nodes}
+    return schemas.ChatMessageOut(chat_history=chat_history, graph=nodes_dict)
+
+
+def time_requests(client, path, repeats, before=None):
+    latencies = []
+    for _ in range(repeats):
+        if before:
+            before()
+        start = time.perf_counter()
+        response = client.post(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return np.array(latencies)
+
+
+def summary(latencies):
+    return f"p50={np.percentile(latencies, 50):.1f}ms p95={np.percentile(latencies, 95):.1f}ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/start response latency")
+    parser.add_argument("--nodes", nargs="+", type=int, default=[10000, 100000])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--changed", type=int, default=10, help="nodes changed between requests")
+    args = parser.parse_args()
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    app.add_api_route("/start-legacy", legacy_start, methods=["POST"], response_model=schemas.ChatMessageOut)
+    client = TestClient(app)
+
+    for num_nodes in args.nodes:
+        routes.nodes = routes.default_workspace.nodes = build_graph(num_nodes)
+        graph = routes.nodes
+        size = len(client.post("/start-legacy").content)
+        print(f"{num_nodes} nodes ({size / 1e6:.1f} MB)")
+
+        legacy = time_requests(client, "/start-legacy", args.repeats)
+        print(f"  legacy   {summary(legacy)}")
+        cold = time_requests(client, "/start", 1)
+        print(f"  cold     {cold[0]:.1f}ms")
+        warm = time_requests(client, "/start", args.repeats)
+        print(f"  warm     {summary(warm)}")
+
+        def change_nodes():
+            for node in graph[: args.changed]:
+                update_node_content(graph, node.id, node.content)
+
+        changed = time_requests(client, "/start", args.repeats, before=change_nodes)
+        print(f"  changed  {summary(changed)} ({args.changed} nodes re-serialized per request)")
@@ -0,0 +1,42 @@
+"""
+Benchmark PDF partitioning over the bundled corpus at increasing worker counts.
+
+Run from backend/src:
+    python -m benchmarks.partition --workers 1 2 4 8
+"""
+import os
+import time
+import argparse
+
+import RAG
+
+
+def run(dir, workers, filenames=None):
+    start = time.perf_counter()
+    elements = RAG.load_pdfs(dir, filenames, workers=workers)
+    return time.perf_counter() - start, len(elements)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF partitioning benchmark")
+    parser.add_argument("--dir", default="./pdfs")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1]
+    )
+    args = parser.parse_args()
+
+    tasks = RAG.partition_tasks(args.dir)
+    print(f"{len(tasks)} partition tasks over {args.dir} "
+          f"(strategy={RAG.PARTITION_STRATEGY}, pages_per_task={RAG.PAGES_PER_TASK})")
+
+    baseline = None
+    reference = None
+    for workers in sorted(set(args.workers)):
+        elapsed, num_elements = run(args.dir, workers)
+        baseline = baseline or elapsed
+        # Every worker count must produce the same elements in the same order
+        if reference is not None and num_elements != reference:
+            print(f"  warning: {num_elements} elements, expected {reference}")
+        reference = reference or num_elements
+        print(f"workers={workers:<3} {elapsed:8.2f}s  "
+              f"speedup={baseline / elapsed:5.2f}x  elements={num_elements}")
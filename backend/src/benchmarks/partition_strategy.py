@@ -0,0 +1,76 @@
+"""
+Compare partition strategies over the bundled corpus: wall-clock time,
+element and chunk counts, and how much of the hi_res output's text each
+strategy recovers.
+
+Run from backend/src:
+    python -m benchmarks.partition_strategy --strategies hi_res fast auto
+"""
+import os
+import re
+import time
+import argparse
+from collections import Counter
+
+import RAG
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def words(elements):
+    return Counter(WORD_PATTERN.findall(" ".join(element.text for element in elements).lower()))
+
+
+def text_recall(elements, reference):
+    """Fraction of the reference's words (with multiplicity) present in elements."""
+    reference_words = words(reference)
+    total = sum(reference_words.values())
+    if not total:
+        return 1.0
+    return sum((words(elements) & reference_words).values()) / total
+
+
+def run(dir, strategy, workers):
+    start = time.perf_counter()
+    files = list(RAG.iter_partitioned(dir, workers=workers, strategy=strategy))
+    elapsed = time.perf_counter() - start
+    chunks = [record for _, elements in files for record in RAG.chunk_records(elements)]
+    return elapsed, dict(files), chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition strategy benchmark")
+    parser.add_argument("--dir", default="./pdfs")
+    parser.add_argument("--strategies", nargs="+", default=["hi_res", "fast", "auto"])
+    parser.add_argument("--workers", type=int, default=RAG.PARTITION_WORKERS)
+    args = parser.parse_args()
+
+    from pypdf import PdfReader
+
+    pages = Counter()
+    for file_path, first_page, last_page, _ in RAG.partition_tasks(args.dir):
+        reader = PdfReader(file_path)
+        for run_first, run_last, strategy in RAG.strategy_runs(
+            reader.pages, first_page, last_page or len(reader.pages)
+        ):
+            pages[strategy] += run_last - run_first + 1
+    print(f"auto would partition {pages['fast']} pages with fast and {pages['hi_res']} with hi_res "
+          f"(workers={args.workers})")
+
+    reference = None
+    for strategy in args.strategies:
+        elapsed, files, chunks = run(args.dir, strategy, args.workers)
+        if reference is None:
+            reference = files
+        elements = [element for file_elements in files.values() for element in file_elements]
+        categories = Counter(element.category for element in elements)
+        recall = [
+            text_recall(files.get(filename, []), reference_elements)
+            for filename, reference_elements in reference.items()
+        ]
+        strategies = Counter(metadata["partition_strategy"] for _, metadata in chunks)
+        print(f"{strategy:<7} {elapsed:8.2f}s  elements={len(elements):<5} "
+              f"titles={categories['Title']:<4} tables={categories['Table']:<3} "
+              f"chunks={len(chunks):<5} "
+              f"text_recall_vs_{args.strategies[0]}={sum(recall) / max(len(recall), 1):.3f}  "
+              f"chunk_strategies={dict(strategies)}")
@@ -0,0 +1,73 @@
+"""
+Benchmark quantized storage for the local vector store against exact search.
+
+Uses the vectors already ingested into the local "demo" store (run ingestion
+with RAG_VECTOR_STORE=local first). A held-out tenth of the chunks serve as
+queries against stores built from the rest, and each quantization mode
+reports scanned bytes, query latency and recall@k relative to exact search.
+
+Run from backend/src:
+    python -m benchmarks.quantization --k 10
+"""
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+import vector_store
+from vector_store import LocalStore
+
+
+def build(kind, dir, properties, vectors):
+    store = LocalStore(kind, dir=dir, quantization=kind)
+    store.add(properties, vectors)
+    return store
+
+
+def search(store, queries, k):
+    start = time.perf_counter()
+    results = [[hit["properties"]["text"] for hit in store.query(q, k)] for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector quantization benchmark")
+    parser.add_argument("--store", default="demo")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=vector_store.RERANK_CANDIDATES)
+    args = parser.parse_args()
+
+    properties, vectors = LocalStore(args.store, quantization="none").live_chunks()
+    if len(vectors) < 20:
+        raise SystemExit("Ingest the corpus with RAG_VECTOR_STORE=local first.")
+    rng = np.random.default_rng(0)
+    held_out = rng.permutation(len(vectors))
+    num_queries = max(len(vectors) // 10, 1)
+    queries = vectors[held_out[:num_queries]]
+    keep = np.sort(held_out[num_queries:])
+    properties = [properties[i] for i in keep]
+    vectors = vectors[keep]
+
+    # The bundled corpus is small, so train on whatever is there
+    vector_store.QUANTIZATION_TRAIN_ROWS = 1
+    vector_store.RERANK_CANDIDATES = args.rerank
+    print(f"{len(vectors)} chunks, {len(queries)} queries, dim={vectors.shape[1]}, "
+          f"k={args.k}, rerank={args.rerank}")
+
+    with tempfile.TemporaryDirectory() as dir:
+        exact = build("none", dir, properties, vectors)
+        truth, exact_latency = search(exact, queries, args.k)
+        baseline_bytes = exact.memory_usage()["vectors_bytes"]
+        print(f"{'mode':<6} {'scan bytes':>12} {'reduction':>10} {'ms/query':>9} {'recall@' + str(args.k):>10}")
+        print(f"{'exact':<6} {baseline_bytes:>12} {1.0:>9.1f}x {exact_latency * 1000:>9.2f} {1.0:>10.3f}")
+        for kind in ("int8", "pq"):
+            store = build(kind, dir, properties, vectors)
+            results, latency = search(store, queries, args.k)
+            recall = np.mean(
+                [len(set(r) & set(t)) / max(len(t), 1) for r, t in zip(results, truth)]
+            )
+            codes_bytes = store.memory_usage()["codes_bytes"]
+            print(f"{kind:<6} {codes_bytes:>12} {baseline_bytes / codes_bytes:>9.1f}x "
+                  f"{latency * 1000:>9.2f} {recall:>10.3f}")
+            store.close()
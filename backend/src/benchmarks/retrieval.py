@@ -0,0 +1,184 @@
+"""
+Retrieval benchmark over the bundled corpus and the labeled queries in
+benchmarks/retrieval_queries.json: ingestion throughput, query latency
+percentiles, and recall@k / MRR for every vector-store backend and
+retrieval mode. Runs offline with the hashing embedder by default; with
+--provider voyage it only stays offline if the embedding cache is warm.
+
+A query counts a hit as relevant when its file and (first) page match a
+labeled page. Latencies are measured after one warm-up pass, so query
+embeddings come from the embedding cache and only retrieval is timed.
+
+Run from backend/src:
+    python -m benchmarks.retrieval --backends local --modes vector keyword hybrid --k 5
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+import RAG
+from embeddings import make_provider
+from vector_store import LocalStore, open_store
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "retrieval_queries.json")
+
+
+def load_queries(path=QUERIES_PATH):
+    with open(path, "r") as f:
+        queries = json.load(f)
+    for query in queries:
+        query["relevant"] = {
+            (entry["filename"], page) for entry in query["relevant"] for page in entry["pages"]
+        }
+    return queries
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def partition_corpus(dir):
+    """Partition and chunk every PDF once; returns the chunks and timing stats."""
+    start = time.perf_counter()
+    files = list(RAG.iter_partitioned(dir))
+    partition_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    objects, metadatas = [], []
+    for _, elements in files:
+        file_objects, file_metadatas = RAG.preprocess_chunks(elements)
+        objects.extend(file_objects)
+        metadatas.extend(file_metadatas)
+    chunk_seconds = time.perf_counter() - start
+    pages = {(m["filename"], m["page_number"]) for m in metadatas}
+    stats = {
+        "files": len(files),
+        "pages_with_chunks": len(pages),
+        "chunks": len(objects),
+        "partition_seconds": partition_seconds,
+        "chunk_seconds": chunk_seconds,
+    }
+    return objects, metadatas, stats
+
+
+def open_benchmark_store(backend, provider, dir):
+    if backend == "local":
+        store = LocalStore("retrieval_benchmark", dir=dir)
+        store.record_embedding_provider(provider)
+        store.embedder = make_provider(provider)
+        return store
+    return open_store(
+        "RetrievalBenchmark", backend=backend, reset=True, embedding_provider=provider
+    )
+
+
+def evaluate(queries, store, mode, k, repeats):
+    """Rank every query once for quality, then time repeats passes."""
+    recalls, reciprocal_ranks, hits_at_k = [], [], []
+    for query in queries:
+        hits = RAG.retrieve(query["query"], store, k, mode=mode)
+        found = [(hit["filename"], hit["page_number"]) in query["relevant"] for hit in hits]
+        matched = {
+            (hit["filename"], hit["page_number"]) for hit in hits
+        } & query["relevant"]
+        recalls.append(len(matched) / len(query["relevant"]))
+        reciprocal_ranks.append(1.0 / (found.index(True) + 1) if any(found) else 0.0)
+        hits_at_k.append(float(any(found)))
+
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            RAG.retrieve(query["query"], store, k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+    return {
+        f"recall@{k}": float(np.mean(recalls)),
+        f"hit_rate@{k}": float(np.mean(hits_at_k)),
+        f"mrr@{k}": float(np.mean(reciprocal_ranks)),
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+            "mean": float(latencies.mean()),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark")
+    parser.add_argument("--dir", default="./pdfs")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--backends", nargs="+", default=["local"], help="local and/or weaviate")
+    parser.add_argument("--modes", nargs="+", default=["vector", "keyword", "hybrid"])
+    parser.add_argument("--provider", default="hashing", help="embedding provider: hashing or voyage")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="retrieval_report.json")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    objects, metadatas, corpus = partition_corpus(args.dir)
+    print(f"{corpus['files']} files, {corpus['chunks']} chunks "
+          f"(partition {corpus['partition_seconds']:.2f}s, chunking {corpus['chunk_seconds']:.2f}s), "
+          f"{len(queries)} queries")
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "provider": args.provider,
+            "k": args.k,
+            "repeats": args.repeats,
+            "partition_strategy": RAG.PARTITION_STRATEGY,
+            "chunk_max_characters": RAG.CHUNK_MAX_CHARACTERS,
+            "queries": len(queries),
+        },
+        "corpus": corpus,
+        "ingestion": {},
+        "results": [],
+    }
+    for backend in args.backends:
+        dir = tempfile.mkdtemp(prefix="retrieval_benchmark_")
+        store = open_benchmark_store(backend, args.provider, dir)
+        try:
+            start = time.perf_counter()
+            RAG.embed_data(objects, metadatas, store)
+            store.flush()
+            insert_seconds = time.perf_counter() - start
+            report["ingestion"][backend] = {
+                "embed_insert_seconds": insert_seconds,
+                "chunks_per_second": len(objects) / insert_seconds if insert_seconds else None,
+            }
+            print(f"{backend}: embedded and inserted {len(objects)} chunks in {insert_seconds:.2f}s")
+            for mode in args.modes:
+                # Warm-up pass so query embeddings are cached before timing
+                for query in queries:
+                    RAG.retrieve(query["query"], store, args.k, mode=mode)
+                result = dict(backend=backend, mode=mode, **evaluate(queries, store, mode, args.k, args.repeats))
+                report["results"].append(result)
+                latency = result["latency_ms"]
+                print(f"  {mode:<8} recall@{args.k}={result[f'recall@{args.k}']:.3f} "
+                      f"hit@{args.k}={result[f'hit_rate@{args.k}']:.3f} "
+                      f"mrr@{args.k}={result[f'mrr@{args.k}']:.3f} "
+                      f"p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms p99={latency['p99']:.2f}ms")
+        finally:
+            if backend == "weaviate":
+                store.client.collections.delete("RetrievalBenchmark")
+            store.close()
+            shutil.rmtree(dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
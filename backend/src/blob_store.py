@@ -0,0 +1,97 @@
+import os
+import re
+import hashlib
+import tempfile
+
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+BLOB_READ_SIZE = 1 << 20
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobStore:
+    """
+    Content-addressed file store: each blob is saved once under
+    <dir>/<first two hex digits>/<sha256>. Writes stream into a temporary
+    file in the same directory while hashing, then are renamed into place,
+    so identical uploads share one file and readers never see a partial blob.
+    """
+
+    def __init__(self, dir: str = BLOB_DIR):
+        self.dir = dir
+        os.makedirs(self.dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        if not SHA256_PATTERN.fullmatch(digest):
+            raise ValueError(f"Invalid blob id: {digest}")
+        return os.path.join(self.dir, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest: str) -> int:
+        return os.path.getsize(self.path(digest))
+
+    def write_chunks(self, chunks):
+        """Store the bytes yielded by chunks. Returns (sha256, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            return self._commit(tmp_path, digest.hexdigest()), size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_file(self, f):
+        """Store the contents of a binary file object, read in BLOB_READ_SIZE pieces."""
+        return self.write_chunks(iter(lambda: f.read(BLOB_READ_SIZE), b""))
+
+    def write_bytes(self, data: bytes):
+        return self.write_chunks([data])
+
+    def _commit(self, tmp_path, digest):
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return digest
+
+    def read_range(self, digest: str, start: int = 0, end: int = None):
+        """Yield the bytes start..end (inclusive; end defaults to the last byte) in pieces."""
+        with open(self.path(digest), "rb") as f:
+            f.seek(start)
+            remaining = (end if end is not None else os.fstat(f.fileno()).st_size - 1) - start + 1
+            while remaining > 0:
+                chunk = f.read(min(BLOB_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single-range "bytes=start-end" header (including open-ended and
+    suffix forms) into inclusive (start, end) offsets. Returns None when the
+    header is absent or not a byte range; raises ValueError when the range
+    can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not first:
+        if not last.isdigit() or int(last) == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - int(last), 0), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
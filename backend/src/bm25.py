@@ -0,0 +1,139 @@
+import os
+import re
+import json
+from array import array
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the rows of a LocalStore, built alongside the vectors.
+
+    Each term keeps its postings as two compact arrays (row ids and term
+    frequencies) that grow in place as rows are added. save() writes them
+    as one CSR snapshot to bm25.npz; load() restores it and the store
+    re-indexes only the rows added after the snapshot.
+
+    Deleted rows stay in the postings until the store is compacted, but
+    delete() drops their length from the total, and scores() counts document
+    frequencies over live rows only, so the statistics match the live corpus.
+    """
+
+    def __init__(self, dir):
+        self.path = os.path.join(dir, "bm25.npz")
+        self.terms = {}  # term -> term id
+        self.postings_rows = []  # term id -> array("i") of row ids
+        self.postings_tfs = []  # term id -> array("i") of term frequencies
+        self.doc_lengths = array("i")  # row -> number of tokens
+        self.total_length = 0
+        self.num_rows = 0  # rows indexed so far
+
+    def add(self, start, texts):
+        """Index texts as rows start, start + 1, ... (rows must arrive in order)."""
+        for row, text in enumerate(texts, start):
+            tokens = tokenize(text or "")
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_id = self.terms.get(token)
+                if term_id is None:
+                    term_id = self.terms[token] = len(self.postings_rows)
+                    self.postings_rows.append(array("i"))
+                    self.postings_tfs.append(array("i"))
+                self.postings_rows[term_id].append(row)
+                self.postings_tfs[term_id].append(tf)
+            if row >= len(self.doc_lengths):
+                self.doc_lengths.extend([0] * (row + 1 - len(self.doc_lengths)))
+            self.doc_lengths[row] = len(tokens)
+            self.total_length += len(tokens)
+            self.num_rows = max(self.num_rows, row + 1)
+
+    def delete(self, rows):
+        """Drop deleted rows from the length statistics; deleting a row twice is harmless."""
+        for row in rows:
+            if row < len(self.doc_lengths):
+                self.total_length -= self.doc_lengths[row]
+                self.doc_lengths[row] = 0
+
+    def scores(self, text, num_rows, alive):
+        """
+        BM25 score of every row below num_rows for the query text, as a dense
+        float32 array (0 for rows sharing no term with the query and for rows
+        not in alive, the live-row mask).
+        """
+        scores = np.zeros(num_rows, dtype=np.float32)
+        num_live = int(np.count_nonzero(alive))
+        if not self.num_rows or not num_live:
+            return scores
+        doc_lengths = np.frombuffer(self.doc_lengths.tobytes(), dtype=np.int32)
+        average_length = max(self.total_length / num_live, 1e-9)
+        all_rows, all_weights = [], []
+        for token in set(tokenize(text)):
+            term_id = self.terms.get(token)
+            if term_id is None:
+                continue
+            # tobytes() snapshots the postings, so concurrent adds are safe
+            rows = np.frombuffer(self.postings_rows[term_id].tobytes(), dtype=np.int32)
+            tfs = np.frombuffer(self.postings_tfs[term_id].tobytes(), dtype=np.int32)
+            keep = rows < num_rows
+            rows, tfs = rows[keep], tfs[keep]
+            keep = alive[rows]
+            rows, tfs = rows[keep], tfs[keep].astype(np.float32)
+            idf = np.log(1 + (num_live - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[rows] / average_length)
+            all_rows.append(rows)
+            all_weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if all_rows:
+            scores += np.bincount(
+                np.concatenate(all_rows), weights=np.concatenate(all_weights), minlength=num_rows
+            )[:num_rows].astype(np.float32)
+        return scores
+
+    def save(self):
+        offsets = np.zeros(len(self.postings_rows) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in self.postings_rows], out=offsets[1:])
+        vocabulary = sorted(self.terms, key=self.terms.get)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vocabulary=np.frombuffer(json.dumps(vocabulary).encode("utf-8"), dtype=np.uint8),
+            offsets=offsets,
+            rows=np.frombuffer(b"".join(r.tobytes() for r in self.postings_rows), dtype=np.int32),
+            tfs=np.frombuffer(b"".join(t.tobytes() for t in self.postings_tfs), dtype=np.int32),
+            doc_lengths=np.frombuffer(self.doc_lengths.tobytes(), dtype=np.int32),
+            num_rows=self.num_rows,
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with np.load(self.path) as saved:
+            vocabulary = json.loads(saved["vocabulary"].tobytes().decode("utf-8"))
+            offsets = saved["offsets"]
+            rows = saved["rows"]
+            tfs = saved["tfs"]
+            self.terms = {term: term_id for term_id, term in enumerate(vocabulary)}
+            self.postings_rows = [
+                array("i", rows[offsets[i] : offsets[i + 1]].tobytes()) for i in range(len(vocabulary))
+            ]
+            self.postings_tfs = [
+                array("i", tfs[offsets[i] : offsets[i + 1]].tobytes()) for i in range(len(vocabulary))
+            ]
+            self.doc_lengths = array("i", saved["doc_lengths"].tobytes())
+            self.num_rows = int(saved["num_rows"])
+        self.total_length = sum(self.doc_lengths)
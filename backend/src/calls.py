@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+
+from external_functions import call_phone_number
+from utils import prepend_node_content
+
+CALL_AGENT_TOKEN = os.getenv("CALL_AGENT_TOKEN")  # shared with the phone agent, sent as X-Call-Token
+# A call the agent never reports as ended is dropped after this long without a transcript batch
+CALL_IDLE_TIMEOUT = float(os.getenv("CALL_IDLE_TIMEOUT", 600))
+CALL_FAILED_PREFIX = "Failed to make phone call"  # what call_phone_number returns when the agent refuses
+
+
+class LiveCall:
+    def __init__(self, release=None):
+        self.release = release  # lets the workspace holding the call node go, if it was held
+        self.last_seen = time.monotonic()
+
+
+live_calls = {}  # call node id -> LiveCall, from dialing until the agent reports the end
+_lock = threading.Lock()
+_reaper = None
+
+
+def start_call(nodes, node_id: str, phone_number: str, topic: str, release=None) -> str:
+    """
+    Dial phone_number through the phone agent, streaming the transcript into
+    the call node node_id, and put the agent's answer at the top of the node.
+    The call is live until the agent posts its last transcript batch (or
+    CALL_IDLE_TIMEOUT passes without one); release() is called then.
+    """
+    global _reaper
+    with _lock:
+        live_calls[node_id] = LiveCall(release)
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_idle_calls, daemon=True)
+            _reaper.start()
+    try:
+        result = call_phone_number(phone_number, topic, node_id=node_id)
+    except Exception:
+        end_call(node_id)
+        raise
+    if result.startswith(CALL_FAILED_PREFIX):
+        end_call(node_id)
+    print(f"[Phone Call] Call result: {result}")
+    prepend_node_content(nodes, node_id, result)
+    return result
+
+
+def touch_call(node_id: str):
+    """Note a transcript batch for node_id, postponing its idle timeout."""
+    with _lock:
+        call = live_calls.get(node_id)
+        if call is not None:
+            call.last_seen = time.monotonic()
+
+
+def end_call(node_id: str):
+    with _lock:
+        call = live_calls.pop(node_id, None)
+    if call is not None and call.release is not None:
+        call.release()
+
+
+def _reap_idle_calls():
+    while True:
+        time.sleep(min(CALL_IDLE_TIMEOUT, 30))
+        now = time.monotonic()
+        with _lock:
+            idle = [node_id for node_id, call in live_calls.items() if now - call.last_seen > CALL_IDLE_TIMEOUT]
+        for node_id in idle:
+            print(f"[Phone Call] No transcript for {node_id} in {CALL_IDLE_TIMEOUT:.0f}s, treating the call as ended")
+            end_call(node_id)
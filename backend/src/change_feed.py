@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+
+class Subscriber:
+    """
+    Wakes one change-feed client's sender when the graph changes.
+
+    Graph mutations happen on request threads, the ingestion worker and
+    background tasks; notify() is called on those threads and wakes the
+    client's sender on the event loop. Any number of changes made while the
+    client is busy result in one wake-up: the sender then builds a single
+    delta from a graph snapshot and its change log, which holds each node
+    changed since the last message once, at its latest state.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.changed = False
+        self.closed = False
+        self.wakeup = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def notify(self, version, node_id, op=None):
+        with self._lock:
+            if self.changed:
+                return  # the sender has been woken already
+            self.changed = True
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            pass  # the event loop has shut down
+
+    async def wait(self):
+        await self.wakeup.wait()
+        self.wakeup.clear()
+
+    def take(self) -> bool:
+        """Whether the graph changed since the last take()."""
+        with self._lock:
+            changed, self.changed = self.changed, False
+        return changed
+
+
+def subscribe(graph, loop) -> Subscriber:
+    subscriber = Subscriber(loop)
+    graph.subscribe(subscriber.notify)
+    return subscriber
+
+
+def unsubscribe(graph, subscriber: Subscriber):
+    graph.unsubscribe(subscriber.notify)
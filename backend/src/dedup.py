@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import zlib
+
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "1") not in ("", "0", "false")
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", 0.85))
+DEDUP_INDEX_PATH = "./rag_dedup.npz"
+SHINGLE_CHARACTERS = 5
+NUM_PERMUTATIONS = 128
+# 32 bands of 4 rows make pairs above ~0.42 estimated Jaccard candidates,
+# so LSH recall at the default threshold is effectively 1
+LSH_BANDS = 32
+MERSENNE_PRIME = (1 << 31) - 1
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text):
+    """Stable 32-bit hashes of the character shingles of the normalized text."""
+    text = WHITESPACE_PATTERN.sub(" ", text.lower()).strip()
+    if len(text) <= SHINGLE_CHARACTERS:
+        grams = {text}
+    else:
+        grams = {text[i : i + SHINGLE_CHARACTERS] for i in range(len(text) - SHINGLE_CHARACTERS + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(text):
+    """MinHash signature of text: NUM_PERMUTATIONS uint32 values."""
+    hashes = shingles(text) % MERSENNE_PRIME
+    # a * x stays below 2**62, so the universal hash cannot overflow uint64
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over every chunk kept in the store, used to drop
+    near-duplicate chunks (repeated headers, disclaimers, summaries) before
+    they are embedded.
+
+    Signatures are split into LSH_BANDS bands; chunks sharing any band are
+    candidates, and a candidate is a duplicate when the fraction of equal
+    signature values (the estimated Jaccard similarity of their shingles)
+    reaches the threshold. Signatures are saved per source file so a file's
+    entries can be dropped when it is re-ingested or removed.
+    """
+
+    def __init__(self, path=DEDUP_INDEX_PATH, threshold=DEDUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.filenames = []  # entry -> source filename (None once removed)
+        self.signatures = []  # entry -> signature
+        self.buckets = {}  # (band, band bytes) -> list of entries
+        self.rows_per_band = NUM_PERMUTATIONS // LSH_BANDS
+
+    def __len__(self):
+        return sum(filename is not None for filename in self.filenames)
+
+    def _bands(self, signature):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * self.rows_per_band : (band + 1) * self.rows_per_band].tobytes()
+
+    def find(self, signature):
+        """Return (entry, similarity) of the most similar indexed chunk at or above the threshold, or None."""
+        best = None
+        seen = set()
+        for key in self._bands(signature):
+            for entry in self.buckets.get(key, ()):
+                if entry in seen or self.filenames[entry] is None:
+                    continue
+                seen.add(entry)
+                similarity = float(np.mean(self.signatures[entry] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (entry, similarity)
+        return best
+
+    def add(self, filename, signature):
+        entry = len(self.signatures)
+        self.filenames.append(filename)
+        self.signatures.append(signature)
+        for key in self._bands(signature):
+            self.buckets.setdefault(key, []).append(entry)
+        return entry
+
+    def remove_files(self, filenames):
+        filenames = set(filenames)
+        if not any(filename in filenames for filename in self.filenames):
+            return
+        kept = [
+            (filename, signature)
+            for filename, signature in zip(self.filenames, self.signatures)
+            if filename is not None and filename not in filenames
+        ]
+        self.clear()
+        for filename, signature in kept:
+            self.add(filename, signature)
+
+    def clear(self):
+        self.filenames, self.signatures, self.buckets = [], [], {}
+
+    def save(self):
+        live = [i for i, filename in enumerate(self.filenames) if filename is not None]
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            filenames=np.frombuffer(
+                json.dumps([self.filenames[i] for i in live]).encode("utf-8"), dtype=np.uint8
+            ),
+            signatures=np.array(
+                [self.signatures[i] for i in live], dtype=np.uint32
+            ).reshape(len(live), NUM_PERMUTATIONS),
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        self.clear()
+        if not os.path.exists(self.path):
+            return self
+        with np.load(self.path) as saved:
+            filenames = json.loads(saved["filenames"].tobytes().decode("utf-8"))
+            signatures = saved["signatures"]
+        if signatures.shape[1:] != (NUM_PERMUTATIONS,):
+            return self
+        for filename, signature in zip(filenames, signatures):
+            self.add(filename, signature)
+        return self
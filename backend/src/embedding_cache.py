@@ -0,0 +1,207 @@
+import os
+import json
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = os.getenv("RAG_EMBEDDING_CACHE_DIR", "./embedding_cache")
+MAX_QUERY_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_MAX_QUERIES", 10000))
+INITIAL_CAPACITY = 1024
+RELEASED_ROWS_FLUSH = 1024  # evicted rows waiting to be reused before the index is saved
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache for one model, keyed by the sha256 of the text.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32) and index.json
+    maps each hash to its row and kind. Document hits return a row view of the
+    memmap, so those reads never copy. Document embeddings are kept until cleared; query
+    embeddings are evicted least-recently-used beyond max_query_entries and
+    their rows reused, but only once an index.json without them has been
+    saved: until then a crash would leave the saved index pointing at a row
+    holding another text's vector. Query hits are returned as copies, since
+    their rows can be reused.
+    """
+
+    def __init__(self, model: str, dir: str = CACHE_DIR, max_query_entries: int = MAX_QUERY_ENTRIES):
+        self.model = model
+        self.dir = os.path.join(dir, model)
+        self.max_query_entries = max_query_entries
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+
+        self.dim = None
+        self.capacity = 0
+        self.num_rows = 0
+        self.documents = {}  # hash -> row
+        self.queries = OrderedDict()  # hash -> row, least recently used first
+        self.free_rows = []  # rows no saved index refers to
+        self.released_rows = []  # evicted rows the saved index may still refer to
+        self._vectors = None
+
+        os.makedirs(self.dir, exist_ok=True)
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.dim = index["dim"]
+            self.num_rows = index["num_rows"]
+            self.documents = index["documents"]
+            self.queries = OrderedDict(index["queries"])
+            self.free_rows = index["free_rows"]
+            self.capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+            )
+
+    def __len__(self):
+        return len(self.documents) + len(self.queries)
+
+    def _grow(self, min_capacity):
+        capacity = max(self.capacity * 2, min_capacity, INITIAL_CAPACITY)
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self.capacity = capacity
+
+    def _allocate_row(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.num_rows >= self.capacity:
+            self._grow(self.num_rows + 1)
+        self.num_rows += 1
+        return self.num_rows - 1
+
+    def _lookup(self, key):
+        row = self.documents.get(key)
+        if row is None:
+            row = self.queries.get(key)
+            if row is not None:
+                self.queries.move_to_end(key)
+        return row
+
+    def get(self, text: str):
+        """Return the cached vector for text, read-only, or None."""
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        with self.lock:
+            results = []
+            for text in texts:
+                key = text_hash(text)
+                row = self._lookup(key)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    vector = self._vectors[row]
+                    if key in self.queries:
+                        vector = np.array(vector)
+                    vector.flags.writeable = False
+                    results.append(vector)
+            return results
+
+    def put(self, text: str, vector, kind: str = "document"):
+        self.put_many([text], [vector], kind)
+
+    def put_many(self, texts, vectors, kind: str = "document"):
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = text_hash(text)
+                if kind != "query" and key in self.queries:
+                    # A text embedded as a document is kept even if it was a query before
+                    self.documents[key] = self.queries.pop(key)
+                    self._dirty = True
+                    continue
+                if self._lookup(key) is not None:
+                    continue
+                vector = np.asarray(vector, dtype=np.float32)
+                if self.dim is None:
+                    self.dim = vector.shape[0]
+                if vector.shape[0] != self.dim:
+                    raise ValueError(
+                        f"Embedding has {vector.shape[0]} dimensions, cache for {self.model} has {self.dim}"
+                    )
+                row = self._allocate_row()
+                self._vectors[row] = vector
+                if kind == "query":
+                    self.queries[key] = row
+                    while len(self.queries) > self.max_query_entries:
+                        _, evicted_row = self.queries.popitem(last=False)
+                        self.released_rows.append(evicted_row)
+                else:
+                    self.documents[key] = row
+                self._dirty = True
+            if len(self.released_rows) >= RELEASED_ROWS_FLUSH:
+                # Save the index so the evicted rows can be reused
+                self._flush()
+
+    def flush(self):
+        """Write the vectors and the index to disk."""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        self._vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "model": self.model,
+                    "dim": self.dim,
+                    "num_rows": self.num_rows,
+                    "documents": self.documents,
+                    "queries": list(self.queries.items()),
+                    "free_rows": self.free_rows + self.released_rows,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.index_path)
+        # The saved index no longer maps the evicted rows, so they can be reused
+        self.free_rows.extend(self.released_rows)
+        self.released_rows = []
+        self._dirty = False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "documents": len(self.documents),
+            "queries": len(self.queries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(model: str) -> EmbeddingCache:
+    """Return the process-wide cache for model, opening it on first use."""
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(model)
+            # Query embeddings are added outside ingestion, so save them on exit
+            atexit.register(_caches[model].flush)
+        return _caches[model]
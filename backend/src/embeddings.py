@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+EMBEDDING_PROVIDER = os.getenv("RAG_EMBEDDING_PROVIDER", "voyage")  # "voyage" or "hashing"
+VOYAGE_MODEL = "voyage-multimodal-3"
+VOYAGE_MAX_RETRIES = 5
+HASHING_DIM = int(os.getenv("RAG_HASHING_DIM", 1024))
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def embedding_text(embedding_object) -> str:
+    return "\n".join(part for part in embedding_object if isinstance(part, str))
+
+
+class EmbeddingProvider:
+    """
+    Turns embedding objects (lists of text and images, as built by
+    RAG.chunk_records) into vectors. name identifies the vector space: it
+    keys the embedding cache and is recorded with each collection, so two
+    providers with the same name must produce interchangeable vectors.
+    """
+
+    name = None
+
+    def embed(self, embedding_objects, kind: str = "document"):
+        raise NotImplementedError
+
+
+class VoyageProvider(EmbeddingProvider):
+    def __init__(self, model: str = VOYAGE_MODEL):
+        import voyageai
+
+        self.name = model
+        self.model = model
+        self.client = voyageai.Client()
+
+    def embed(self, embedding_objects, kind: str = "document"):
+        """
+        Embed one batch, retrying transient failures with exponential backoff.
+        A batch the API rejects outright (e.g. over the token limit) is split in
+        half and each half embedded separately.
+        """
+        import voyageai.error
+
+        for attempt in range(VOYAGE_MAX_RETRIES):
+            try:
+                return self.client.multimodal_embed(
+                    embedding_objects, model=self.model, truncation=False
+                ).embeddings
+            except voyageai.error.InvalidRequestError:
+                if len(embedding_objects) == 1:
+                    raise
+                middle = len(embedding_objects) // 2
+                return self.embed(embedding_objects[:middle], kind) + self.embed(
+                    embedding_objects[middle:], kind
+                )
+            except Exception as e:
+                if attempt == VOYAGE_MAX_RETRIES - 1:
+                    raise
+                print(f"[RAG] Embedding batch failed ({e}), retrying")
+                time.sleep(min(2**attempt, 30))
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Deterministic CPU embedder for offline ingestion, tests and air-gapped
+    deployments. Word unigrams and bigrams are hashed (crc32, so vectors are
+    stable across processes) into dim signed buckets with sublinear term
+    frequency, and each vector is L2-normalized. A batch is assembled with a
+    single bincount, so embedding costs microseconds per chunk. Only lexical
+    overlap is captured; images in embedding objects are ignored.
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, embedding_objects, kind: str = "document"):
+        rows, hashes = [], []
+        for row, embedding_object in enumerate(embedding_objects):
+            features = self._features(embedding_text(embedding_object))
+            rows.extend([row] * len(features))
+            hashes.extend(zlib.crc32(feature.encode("utf-8")) for feature in features)
+        vectors = np.zeros((len(embedding_objects), self.dim), dtype=np.float32)
+        if hashes:
+            hashes = np.array(hashes, dtype=np.uint32)
+            # The low bits pick the bucket, the top bit the sign
+            buckets = np.array(rows, dtype=np.int64) * self.dim + (hashes % self.dim)
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            counts = np.bincount(buckets, minlength=vectors.size)
+            signed = np.bincount(buckets, weights=signs, minlength=vectors.size)
+            # signed / counts is the sign of the bucket's feature (the mean sign
+            # on collisions), scaled by a sublinear term frequency
+            nonzero = counts > 0
+            weights = np.zeros(vectors.size)
+            weights[nonzero] = (signed[nonzero] / counts[nonzero]) * np.log1p(counts[nonzero])
+            vectors = weights.reshape(vectors.shape).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return list(vectors / np.maximum(norms, 1e-12))
+
+
+def provider_name(kind: str = EMBEDDING_PROVIDER) -> str:
+    """Map a configured kind ("voyage", "hashing") to the provider's name; names map to themselves."""
+    if kind == "voyage":
+        return VOYAGE_MODEL
+    if kind == "hashing":
+        return f"hashing-{HASHING_DIM}"
+    return kind
+
+
+def make_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    """Build a provider from its configured kind or a recorded provider name."""
+    name = provider_name(name)
+    if name == VOYAGE_MODEL:
+        return VoyageProvider()
+    if name.startswith("hashing-"):
+        return HashingProvider(int(name.split("-", 1)[1]))
+    raise ValueError(f"Unknown embedding provider: {name}")
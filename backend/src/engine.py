@@ -16,9 +16,9 @@ from openai import OpenAI
 from external_functions import (
     query_perplexity,
     query_rag,
-    call_phone_number,
     send_email,
 )
+from calls import start_call
 from utils import *
 import schemas
 
@@ -73,10 +73,20 @@ def init_agent(nodes: list[schemas.NodeV2], active_node: str):
     return root_node_id
 
 
-def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
+def init_root(nodes: list[schemas.NodeV2]) -> str:
+    """Create the root node of an empty graph from the brief, with the id "0" clients expect."""
+    root_node = init_agent(nodes, None)
+    change_node(nodes, root_node, type=schemas.NodeType.root)
+    rename_node(nodes, root_node, "0")
+    return "0"
+
+
+def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection, hold_workspace=None):
     """
     Executes mode I of the research agent, which expands knowledge by using
-    tools to gather information.
+    tools to gather information. hold_workspace() keeps the graph's workspace
+    in memory while a call it places is live and returns the function that
+    lets it go.
     """
     if not active_node:
         print("No active node selected")
@@ -90,8 +100,15 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
     current_node_name = current_node.name
     current_node_content = current_node.content
 
+    # Only offer the retrieve tool when there is a RAG collection to query
+    if collection is not None:
+        system_prompt, tools = mode_i_retrieve, mode_i_tools
+    else:
+        system_prompt = mode_i
+        tools = [tool for tool in mode_i_tools if tool["function"]["name"] != "retrieve"]
+
     messages = [
-        {"role": "system", "content": mode_i},
+        {"role": "system", "content": system_prompt},
         {
             "role": "user",
             "content": f"""
@@ -112,7 +129,7 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
     ]
 
     response = client.chat.completions.create(
-        model="gpt-4o", messages=messages, tools=mode_i_tools, temperature=0.7
+        model="gpt-4o", messages=messages, tools=tools, temperature=0.7
     )
     message = response.choices[0].message
     new_nodes = []
@@ -131,7 +148,7 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
                     source="perplexity_search",
                     timestamp=datetime.now(),
                 )
-                current_node.children.append(new_node_id)
+                update_node_children(nodes, current_node.id, new_node_id)
                 new_nodes.append(new_node_id)
             elif tool_call.function.name == "retrieve":
                 args = json.loads(tool_call.function.arguments)
@@ -144,7 +161,7 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
                     source="rag",
                     timestamp=datetime.now(),
                 )
-                current_node.children.append(new_node_id)
+                update_node_children(nodes, current_node.id, new_node_id)
                 new_nodes.append(new_node_id)
             elif tool_call.function.name == "email":
                 args = json.loads(tool_call.function.arguments)
@@ -157,20 +174,28 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
                     source="email",
                     timestamp=datetime.now(),
                 )
-                current_node.children.append(new_node_id)
+                update_node_children(nodes, current_node.id, new_node_id)
                 new_nodes.append(new_node_id)
             elif tool_call.function.name == "phone":
                 args = json.loads(tool_call.function.arguments)
-                result = call_phone_number(os.getenv("PHONE_NUMBER_TO"), args["topic"])
+                # Create the node first so the phone agent can stream the
+                # transcript into it while the call is in progress
                 new_node_id = create_node(
                     nodes=nodes,
                     name=args["name"],
                     type="call",
-                    content=result,
+                    content="",
                     source="call",
                     timestamp=datetime.now(),
                 )
-                current_node.children.append(new_node_id)
+                update_node_children(nodes, current_node.id, new_node_id)
+                start_call(
+                    nodes,
+                    new_node_id,
+                    os.getenv("PHONE_NUMBER_TO"),
+                    args["topic"],
+                    release=hold_workspace() if hold_workspace else None,
+                )
                 new_nodes.append(get_node_by_id(nodes, new_node_id))
             elif tool_call.function.name == "ask":
                 args = json.loads(tool_call.function.arguments)
@@ -182,7 +207,7 @@ def execute_mode_i(nodes: list[schemas.NodeV2], active_node: str, collection):
                     source="question",
                     timestamp=datetime.now(),
                 )
-                current_node.children.append(new_node_id)
+                update_node_children(nodes, current_node.id, new_node_id)
                 new_nodes.append(new_node_id)
 
     if verbose:
@@ -476,7 +501,7 @@ def process_chat_message(user_message: str, node_id: str, nodes, chat_messages):
         The newly created node
     """
     transcript = ""
-    for msg in chat_messages:
+    for msg in list(chat_messages):
         transcript += f"{msg.role}: {msg.message}\n"
     # Find the parent node if one was specified
     parent_node = get_node_by_id(nodes, node_id) if node_id else None
@@ -517,6 +542,7 @@ def process_chat_message(user_message: str, node_id: str, nodes, chat_messages):
                 if parent_node:
                     update_node_children(nodes, parent_node.id, response_node_id)
 
+                record_chat_exchange(nodes, chat_messages, node_id, user_message, args["content"])
                 return get_node_by_id(nodes, response_node_id)
 
     # Fallback: create a simple response node if no tool calls
@@ -533,4 +559,21 @@ def process_chat_message(user_message: str, node_id: str, nodes, chat_messages):
     if parent_node:
         update_node_children(nodes, parent_node.id, response_node_id)
 
+    record_chat_exchange(nodes, chat_messages, node_id, user_message, message.content or user_message)
     return get_node_by_id(nodes, response_node_id)
+
+
+def record_chat_exchange(nodes, chat_messages, node_id: str, user_message: str, reply: str):
+    """Add the user's message and the assistant's reply to the chat history."""
+    for role, text in ((schemas.RoleEnum.user, user_message), (schemas.RoleEnum.assistant, reply)):
+        add_chat_message(
+            nodes,
+            chat_messages,
+            schemas.ChatMessage(
+                id=str(uuid.uuid4()),
+                role=role,
+                node_id=node_id or "",
+                message=text,
+                timestamp=datetime.utcnow(),
+            ),
+        )
@@ -28,12 +28,32 @@ def query_perplexity(client: OpenAI, query: str) -> str:
     return response.choices[0].message.content
 
 
-def query_rag(query: str, collection) -> str:
-    response = collection.query.near_text(query)
-    return response.objects[0].properties["text"]
-
-
-def call_phone_number(phone_number: str, topic: str) -> str:
+def query_rag(query: str, collection, limit: int = 5) -> str:
+    """
+    Retrieves the top passages for the query from the RAG vector store
+    (returned by RAG.init_rag) and formats them as a ranked, cited list.
+    """
+    from RAG import retrieve
+
+    print(f"[RAG] Query: {query}")
+    hits = retrieve(query, collection, limit)
+    if not hits:
+        return "No matching passages found."
+    passages = []
+    for hit in hits:
+        source = hit["filename"] or "unknown source"
+        if hit["page_number"] is not None:
+            source += f", p. {hit['page_number']}"
+        score = "keyword match" if hit["distance"] is None else f"distance {hit['distance']:.3f}"
+        passages.append(f"{hit['rank']}. [{source}] ({score})\n{hit['text']}")
+    return "\n\n".join(passages)
+
+
+def call_phone_number(phone_number: str, topic: str, node_id: str = None) -> str:
+    """
+    Starts a call through the phone agent service. When node_id is given, the
+    agent streams batched transcript updates into that node while the call runs.
+    """
     print(f"[Phone Call] Calling {phone_number} about {topic}")
     # Make HTTP POST request to call endpoint
     import requests
@@ -41,7 +61,12 @@ def call_phone_number(phone_number: str, topic: str) -> str:
     response = requests.post(
         "http://localhost:6060/make-call",
         headers={"accept": "application/json", "Content-Type": "application/json"},
-        json={"phone_number": phone_number, "topic": topic, "max_duration": 300},
+        json={
+            "phone_number": phone_number,
+            "topic": topic,
+            "max_duration": 300,
+            "node_id": node_id,
+        },
     )
 
     if response.status_code != 202:  # Changed from 200 to 202 to match the API response
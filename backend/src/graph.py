@@ -0,0 +1,332 @@
+import os
+import json
+import uuid
+import threading
+from collections import deque
+from itertools import chain
+
+GRAPH_CHANGE_LOG_SIZE = int(os.getenv("GRAPH_CHANGE_LOG_SIZE", 10000))
+SNAPSHOT_PAGE_SIZE = 256  # nodes per page of a snapshot's node list
+SNAPSHOT_INDEX_BUCKETS = 1024  # dicts a snapshot's id index is split into
+
+
+def _bucket(node_id):
+    return hash(node_id) % SNAPSHOT_INDEX_BUCKETS
+
+
+class GraphSnapshot:
+    """
+    The graph as of one version, for building responses while writers keep
+    changing it. Nodes are never changed in place (writers swap in a changed
+    copy), so a snapshot shares every node object, and each node's cached
+    JSON, with the live graph and the other snapshots. The node list is
+    stored as pages of SNAPSHOT_PAGE_SIZE nodes and the id index as
+    SNAPSHOT_INDEX_BUCKETS dicts, and a snapshot shares the pages and buckets
+    no change touched with the one before it. It supports the reads the routes make: iterating,
+    indexing and len() like the node list, get() and node_json() like the
+    graph.
+    """
+
+    def __init__(self, graph, pages: list, buckets: list, size: int, version: int, reset_version: int, num_messages: int):
+        self.graph = graph
+        self.graph_id = graph.graph_id
+        self.json_cache = graph.json_cache
+        self.pages = pages  # tuples of nodes
+        self.buckets = buckets  # node id -> node, split by _bucket()
+        self.size = size
+        self.version = version
+        self.reset_version = reset_version
+        self.num_messages = num_messages
+
+    def __iter__(self):
+        return chain.from_iterable(self.pages)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError("snapshot index out of range")
+        return self.pages[position // SNAPSHOT_PAGE_SIZE][position % SNAPSHOT_PAGE_SIZE]
+
+    def get(self, node_id):
+        return self.buckets[_bucket(node_id)].get(node_id)
+
+    def node_json(self, node_id) -> bytes:
+        node = self.buckets[_bucket(node_id)][node_id]
+        cached = self.json_cache.get(node_id)
+        if cached is not None and cached[0] is node:
+            return cached[1]
+        return self.graph.fragment(node)
+
+    def changes_since(self, version: int, graph_id: str = None):
+        """
+        Ids of the nodes added, changed or removed after version, up to this
+        snapshot's, or None when the change log no longer reaches back that
+        far (or version belongs to another graph) and the client needs a
+        full snapshot.
+        """
+        if graph_id not in (None, self.graph_id) or version > self.version or version < self.reset_version:
+            return None
+        if version == self.version:
+            return set()
+        return self.graph.changed_between(version, self.version)
+
+    def messages(self, chat_messages) -> list:
+        """The chat history as of this snapshot."""
+        return list(chat_messages[: self.num_messages])
+
+    def messages_since(self, chat_messages, version: int):
+        """Chat messages added after version, up to this snapshot's."""
+        return [
+            message
+            for message, message_version in zip(
+                chat_messages[: self.num_messages], self.graph.message_versions[: self.num_messages]
+            )
+            if message_version > version
+        ]
+
+
+class Graph(list):
+    """
+    The research graph: the NodeV2 objects in insertion order, so code that
+    iterates, indexes or appends to the node list keeps working, plus an id
+    index and a monotonic version.
+
+    Writers (expansions, chat, uploads, calls) run on different threads and
+    serialize on lock, which the methods here and the helpers in utils take
+    for each mutation, never across an LLM call. Nodes are copy-on-write:
+    update() swaps in a changed copy instead of changing the node, so a node
+    object, once in the graph, never changes. Readers use snapshot(), an
+    immutable view as of one version that shares those node objects, and
+    never wait for or race with a writer beyond building the snapshot, which
+    copies only the pages of the node list and buckets of the id index
+    changed since the last one.
+
+    Every mutation bumps the version and records (version, node_id) in a
+    change log bounded to log_size entries, so a client that has seen
+    version v can be sent just the nodes touched since. graph_id is new for
+    each Graph, so versions from another server run are never mistaken for
+    this one's.
+
+    fragment(node) caches each node's serialized JSON, so responses are
+    assembled from bytes instead of re-validating and re-serializing every
+    node.
+
+    Listeners added with subscribe() are called as listener(version,
+    node_id, op) for every recorded change (node_id None for chat messages),
+    on the thread that made it, with lock held. op describes the change when
+    the caller knows it, e.g. ("content", text) or ("append", text, offset);
+    None means the node as a whole was added or changed.
+    """
+
+    def __init__(self, nodes=(), log_size: int = GRAPH_CHANGE_LOG_SIZE):
+        super().__init__()
+        self.graph_id = str(uuid.uuid4())
+        self.lock = threading.RLock()
+        self.index = {}  # node id -> node
+        self.positions = {}  # node id -> position in the list
+        self.buckets = [{} for _ in range(SNAPSHOT_INDEX_BUCKETS)]  # self.index split by _bucket()
+        self.dirty_pages = set()  # pages and buckets changed since the last snapshot
+        self.dirty_buckets = set()
+        self.version = 0
+        self.changes = deque(maxlen=log_size)  # (version, node id), oldest first
+        self.message_versions = []  # version at which each chat message was added
+        self.json_cache = {}  # node id -> (node, b'"<id>":{...}')
+        self.listeners = []
+        self.reset_version = 0  # version of the last replace()
+        self._snapshot = None
+        for node in nodes:
+            self.append(node)
+
+    def _index(self, node_id, node):
+        bucket = _bucket(node_id)
+        if node is None:
+            self.buckets[bucket].pop(node_id, None)
+        else:
+            self.buckets[bucket][node_id] = node
+        self.dirty_buckets.add(bucket)
+
+    def _record(self, node_id, op=None):
+        self.version += 1
+        self.changes.append((self.version, node_id))
+        for listener in self.listeners:
+            listener(self.version, node_id, op)
+        return self.version
+
+    def append(self, node):
+        with self.lock:
+            self.positions[node.id] = len(self)
+            self.dirty_pages.add(len(self) // SNAPSHOT_PAGE_SIZE)
+            super().append(node)
+            self.index[node.id] = node
+            self._index(node.id, node)
+            self._record(node.id)
+
+    def load(self, nodes, num_messages: int = 0, version: int = 0):
+        """
+        Bulk-add nodes restored from storage (and account for num_messages
+        restored chat messages) without logging a change for each: a new
+        graph_id already makes clients start from a full snapshot. version
+        continues the numbering of the storage's own log, if it has one.
+        """
+        with self.lock:
+            self.positions.update((node.id, len(self) + i) for i, node in enumerate(nodes))
+            super().extend(nodes)
+            self.index.update((node.id, node) for node in nodes)
+            for node in nodes:
+                self.buckets[_bucket(node.id)][node.id] = node
+            self._snapshot = None  # the next snapshot is built from scratch
+            self.version = max(self.version, version)
+            self.message_versions.extend([self.version] * num_messages)
+
+    def replace(self, nodes):
+        """
+        Swap in a whole new set of nodes, e.g. an imported graph, indexing
+        them in the same pass. Listeners see a ("reset",) change followed by
+        each node being added; clients holding an earlier version are sent a
+        full snapshot.
+        """
+        with self.lock:
+            super().clear()
+            self.index.clear()
+            self.positions.clear()
+            self.buckets = [{} for _ in range(SNAPSHOT_INDEX_BUCKETS)]
+            self.json_cache.clear()
+            self._snapshot = None
+            self.reset_version = self._record(None, ("reset",))
+            for node in nodes:
+                self.append(node)
+
+    def get(self, node_id):
+        return self.index.get(node_id)
+
+    def update(self, node_id, op=None, **fields):
+        """
+        Replace the node with a copy that has fields changed, recording op.
+        Callers computing fields from the node's current ones hold lock
+        around both. Returns the new node, or None if there is no such node.
+        """
+        with self.lock:
+            node = self.index.get(node_id)
+            if node is None:
+                return None
+            node = node.model_copy(update=fields)
+            position = self.positions[node_id]
+            super().__setitem__(position, node)
+            self.dirty_pages.add(position // SNAPSHOT_PAGE_SIZE)
+            self.index[node_id] = node
+            self._index(node_id, node)
+            self.json_cache.pop(node_id, None)
+            self._record(node_id, op)
+            return node
+
+    def snapshot(self) -> GraphSnapshot:
+        """The graph as of now, reused until the next change."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.version:
+            return snapshot
+        with self.lock:
+            if self._snapshot is None or self._snapshot.version != self.version:
+                previous = self._snapshot
+                num_pages = -(-len(self) // SNAPSHOT_PAGE_SIZE)
+                if previous is None:
+                    pages = [None] * num_pages
+                    dirty_pages = range(num_pages)
+                    buckets = [bucket.copy() for bucket in self.buckets]
+                else:
+                    # Share what did not change with the previous snapshot
+                    pages = previous.pages[:num_pages] + [None] * (num_pages - len(previous.pages))
+                    dirty_pages = [page for page in self.dirty_pages if page < num_pages]
+                    buckets = list(previous.buckets)
+                    for bucket in self.dirty_buckets:
+                        buckets[bucket] = self.buckets[bucket].copy()
+                for page in dirty_pages:
+                    pages[page] = tuple(self[page * SNAPSHOT_PAGE_SIZE : (page + 1) * SNAPSHOT_PAGE_SIZE])
+                self.dirty_pages.clear()
+                self.dirty_buckets.clear()
+                self._snapshot = GraphSnapshot(
+                    self,
+                    pages,
+                    buckets,
+                    len(self),
+                    self.version,
+                    self.reset_version,
+                    len(self.message_versions),
+                )
+            return self._snapshot
+
+    def subscribe(self, listener):
+        self.listeners = self.listeners + [listener]
+
+    def unsubscribe(self, listener):
+        self.listeners = [other for other in self.listeners if other != listener]
+
+    def fragment(self, node) -> bytes:
+        """The node as a JSON object member, b'"<id>":{...}', cached while it is the graph's current copy."""
+        cached = self.json_cache.get(node.id)
+        if cached is not None and cached[0] is node:
+            return cached[1]
+        fragment = json.dumps(node.id).encode() + b":" + node.model_dump_json().encode()
+        if self.index.get(node.id) is node:
+            self.json_cache[node.id] = (node, fragment)
+        return fragment
+
+    def node_json(self, node_id) -> bytes:
+        """The current node with node_id as a JSON object member."""
+        return self.fragment(self.index[node_id])
+
+    def remove_node(self, node_id):
+        with self.lock:
+            node = self.index.pop(node_id, None)
+            if node is not None:
+                position = self.positions.pop(node_id)
+                super().__delitem__(position)
+                for i in range(position, len(self)):
+                    self.positions[self[i].id] = i
+                # Later nodes moved up, so every page from here on changed
+                self.dirty_pages.update(range(position // SNAPSHOT_PAGE_SIZE, len(self) // SNAPSHOT_PAGE_SIZE + 1))
+                self._index(node_id, None)
+                self.json_cache.pop(node_id, None)
+                self._record(node_id, ("delete",))
+            return node
+
+    def rename(self, node_id, new_id):
+        """Change a node's id; clients see the old id removed and the new one added."""
+        with self.lock:
+            node = self.index.pop(node_id).model_copy(update={"id": new_id})
+            position = self.positions.pop(node_id)
+            super().__setitem__(position, node)
+            self.dirty_pages.add(position // SNAPSHOT_PAGE_SIZE)
+            self.index[new_id] = node
+            self.positions[new_id] = position
+            self._index(node_id, None)
+            self._index(new_id, node)
+            self.json_cache.pop(node_id, None)
+            self._record(node_id, ("rename", new_id))
+            self._record(new_id)
+            return node
+
+    def record_message(self, message):
+        """Version a chat message appended to the chat history."""
+        with self.lock:
+            self.message_versions.append(self._record(None, ("message", message)))
+
+    def changed_between(self, version: int, until: int):
+        """
+        Ids of the nodes added, changed or removed after version and up to
+        until, or None when the change log no longer reaches back that far.
+        """
+        with self.lock:
+            oldest = self.changes[0][0] if self.changes else self.version + 1
+            if version < oldest - 1:
+                return None
+            node_ids = set()
+            for change_version, node_id in reversed(self.changes):
+                if change_version <= version:
+                    break
+                if node_id is not None and change_version <= until:
+                    node_ids.add(node_id)
+            return node_ids
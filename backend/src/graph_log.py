@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import threading
+
+import schemas
+
+GRAPH_LOG_DIR = os.getenv("GRAPH_LOG_DIR", "./graph_log")
+GRAPH_LOG_FSYNC_INTERVAL = float(os.getenv("GRAPH_LOG_FSYNC_INTERVAL", 0.05))  # seconds
+GRAPH_SNAPSHOT_INTERVAL = int(os.getenv("GRAPH_SNAPSHOT_INTERVAL", 10000))  # log records
+SEGMENT_PATTERN = re.compile(r"log-(\d+)\.jsonl")
+SNAPSHOT_PATTERN = re.compile(r"snapshot-(\d+)\.json")
+
+
+def apply_record(nodes_by_id: dict, chat_messages: list, record):
+    """
+    Apply one log record, [version, node id, kind, *args], to restored state
+    (nodes not yet in a Graph, so they are changed in place). Every kind is
+    applied so that replaying a record again leaves the same result.
+    """
+    _, node_id, kind, *args = record
+    if kind == "message":
+        chat_messages.append(schemas.ChatMessage.model_validate(args[0]))
+        return
+    if kind == "reset":
+        nodes_by_id.clear()
+        return
+    if kind == "node":
+        nodes_by_id[node_id] = schemas.NodeV2.model_validate(args[0])
+        return
+    node = nodes_by_id.get(node_id)
+    if node is None:
+        return
+    if kind == "link":
+        if args[0] not in node.children:
+            node.children.append(args[0])
+    elif kind == "content":
+        node.content = args[0]
+    elif kind == "append":
+        text, offset = args
+        if node.content[offset:offset + len(text)] != text:
+            node.content = node.content[:offset] + text
+    elif kind == "status":
+        node.metadata.status = args[0]
+    elif kind == "delete":
+        del nodes_by_id[node_id]
+    elif kind == "rename":
+        # Rebuild the dict so the node keeps its place in the order
+        node.id = args[0]
+        renamed = {(args[0] if key == node_id else key): value for key, value in nodes_by_id.items()}
+        nodes_by_id.clear()
+        nodes_by_id.update(renamed)
+
+
+class GraphLog:
+    """
+    Persists the live graph and chat history as an append-only log of
+    mutations plus periodic snapshots, in dir.
+
+    Each change the graph records becomes one JSON line, [version, node id,
+    kind, *args]: the op the change describes ("link", "content", "append",
+    "status", "delete", "rename", "message", "reset") or, for added nodes
+    and other changes, the whole node ("node"). Lines are encoded on the
+    thread that made the change and written by a background thread, which
+    fsyncs once per fsync_interval for everything queued since.
+
+    Every snapshot_interval records the graph is written to
+    snapshot-<version>.json, in the {id: node} format utils.export_nodes
+    writes, and a new log-<version>.jsonl segment is started, so recovery
+    reads the latest snapshot and replays at most the records written since
+    the previous one.
+    """
+
+    def __init__(
+        self,
+        graph,
+        chat_messages,
+        dir: str = GRAPH_LOG_DIR,
+        fsync_interval: float = GRAPH_LOG_FSYNC_INTERVAL,
+        snapshot_interval: int = GRAPH_SNAPSHOT_INTERVAL,
+    ):
+        self.graph = graph
+        self.chat_messages = chat_messages
+        self.dir = dir
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.pending = []  # encoded lines not yet written
+        self.records_since_snapshot = 0
+        self.segment = None
+        self.segment_path = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _files(self, pattern):
+        """(version, path) of the files in dir matching pattern, oldest first."""
+        files = []
+        for name in os.listdir(self.dir):
+            match = pattern.fullmatch(name)
+            if match:
+                files.append((int(match.group(1)), os.path.join(self.dir, name)))
+        return sorted(files)
+
+    def load(self) -> int:
+        """Restore the latest snapshot plus the log records after it into the empty graph. Returns the node count."""
+        snapshots = self._files(SNAPSHOT_PATTERN)
+        snapshot_version, nodes_by_id, messages = 0, {}, []
+        if snapshots:
+            snapshot_version, path = snapshots[-1]
+            with open(path, "r") as f:
+                nodes_by_id = {
+                    node_id: schemas.NodeV2.model_validate(node) for node_id, node in json.load(f).items()
+                }
+            messages_path = path[: -len(".json")] + ".messages.json"
+            if os.path.exists(messages_path):
+                with open(messages_path, "r") as f:
+                    messages = [schemas.ChatMessage.model_validate(message) for message in json.load(f)]
+
+        version, replayed = snapshot_version, 0
+        for _, path in self._files(SEGMENT_PATTERN):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line of a segment is torn if the server died mid-write
+                        break
+                    if record[0] <= snapshot_version:
+                        continue
+                    apply_record(nodes_by_id, messages, record)
+                    version = max(version, record[0])
+                    replayed += 1
+
+        self.chat_messages.extend(messages)
+        self.graph.load(list(nodes_by_id.values()), num_messages=len(messages), version=version)
+        self.records_since_snapshot = replayed
+        print(f"[Graph] Restored {len(nodes_by_id)} nodes from snapshot {snapshot_version} "
+              f"and {replayed} log records")
+        return len(nodes_by_id)
+
+    def notify(self, version, node_id, op=None):
+        if op is None:
+            if self.graph.get(node_id) is None:
+                return
+            # Reuse the graph's cached JSON for the node: '"<id>":{...}'
+            fragment = self.graph.node_json(node_id)
+            node_json = fragment[len(json.dumps(node_id).encode()) + 1:]
+            line = b"[%d,%s,\"node\",%s]\n" % (version, json.dumps(node_id).encode(), node_json)
+        elif op[0] == "reset":
+            line = json.dumps([version, None, "reset"]).encode() + b"\n"
+        elif op[0] == "message":
+            message = schemas.ChatMessage.model_validate(op[1]).model_dump(mode="json")
+            line = json.dumps([version, None, "message", message]).encode() + b"\n"
+        else:
+            line = json.dumps([version, node_id, *op]).encode() + b"\n"
+        with self._lock:
+            self.pending.append(line)
+
+    def start(self):
+        self._open_segment(self.graph.version)
+        self.graph.subscribe(self.notify)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self, snapshot: bool = False):
+        """
+        Stop the writer thread and write whatever is still queued. With
+        snapshot, records since the last snapshot are compacted into a new
+        one, so the next load() has nothing to replay.
+        """
+        self.graph.unsubscribe(self.notify)
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._write_pending()
+        if snapshot and self.records_since_snapshot:
+            self.snapshot()
+        self.segment.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.fsync_interval)
+            try:
+                self._write_pending()
+                if self.records_since_snapshot >= self.snapshot_interval:
+                    self.snapshot()
+            except Exception as e:
+                print(f"[Graph] Writing the mutation log failed: {e}")
+
+    def _open_segment(self, version):
+        self.segment_path = os.path.join(self.dir, f"log-{version:012d}.jsonl")
+        self.segment = open(self.segment_path, "ab")
+
+    def _write_pending(self):
+        with self._lock:
+            lines, self.pending = self.pending, []
+        if lines:
+            self.segment.write(b"".join(lines))
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            self.records_since_snapshot += len(lines)
+
+    def snapshot(self):
+        """Write the graph to a snapshot and start a new log segment."""
+        # Every record up to the view's version was queued while it was being
+        # made, so it is written to the segment being closed; later records
+        # go to the new one
+        view = self.graph.snapshot()
+        version = view.version
+        self._write_pending()
+        previous_segment = self.segment_path
+        self.segment.close()
+        self._open_segment(version)
+        self.records_since_snapshot = 0
+
+        path = os.path.join(self.dir, f"snapshot-{version:012d}.json")
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"{")
+            for i, node in enumerate(view):
+                f.write((b"," if i else b"") + view.node_json(node.id))
+            f.write(b"}")
+            f.flush()
+            os.fsync(f.fileno())
+        messages = [
+            schemas.ChatMessage.model_validate(message).model_dump(mode="json")
+            for message in view.messages(self.chat_messages)
+        ]
+        messages_path = path[: -len(".json")] + ".messages.json"
+        with open(messages_path + ".tmp", "w") as f:
+            json.dump(messages, f)
+        os.replace(messages_path + ".tmp", messages_path)
+        os.replace(path + ".tmp", path)
+
+        # Records after version may still be in the segment just closed;
+        # older segments and snapshots are no longer needed
+        for _, old_path in self._files(SNAPSHOT_PATTERN):
+            if old_path != path:
+                os.remove(old_path)
+                if os.path.exists(old_path[: -len(".json")] + ".messages.json"):
+                    os.remove(old_path[: -len(".json")] + ".messages.json")
+        for _, old_path in self._files(SEGMENT_PATTERN):
+            if old_path not in (previous_segment, self.segment_path):
+                os.remove(old_path)
+        print(f"[Graph] Snapshot at version {version}")
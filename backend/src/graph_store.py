@@ -0,0 +1,209 @@
+import os
+import threading
+
+from sqlalchemy import delete, inspect, literal_column
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+import schemas
+from database import Base, SessionLocal, engine
+
+GRAPH_PERSIST = os.getenv("GRAPH_PERSIST", "sqlite")  # "sqlite", "log" (graph_log.py) or "0"
+GRAPH_FLUSH_INTERVAL = float(os.getenv("GRAPH_FLUSH_INTERVAL", 0.5))  # seconds
+GRAPH_FLUSH_BATCH_SIZE = int(os.getenv("GRAPH_FLUSH_BATCH_SIZE", 500))
+SQL_BATCH_SIZE = 500  # ids per IN (...) clause
+
+
+def ensure_schema(bind=engine):
+    """
+    Create the tables, recreating any that predate columns the models now
+    have. Those tables were never written before the graph was persisted,
+    so nothing is lost.
+    """
+    existing = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if existing.has_table(table.name):
+            columns = {column["name"] for column in existing.get_columns(table.name)}
+            if columns >= set(table.columns.keys()):
+                continue
+            print(f"[Graph] Recreating outdated table {table.name}")
+            table.drop(bind)
+        table.create(bind)
+
+
+def batches(items, size=SQL_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class GraphStore:
+    """
+    Persists the live graph and chat history to the database with
+    write-behind. The graph's change listener only records which nodes
+    changed; a background thread writes them in one transaction every
+    flush_interval seconds, or sooner once batch_size nodes are waiting, so
+    requests never wait on SQLite.
+
+    Each node row holds the whole NodeV2 as JSON, so load() rebuilds the
+    graph from a single query. Edge rows mirror each node's children,
+    indexed on both endpoints, for queries over the graph's structure. Nodes
+    are restored in the order they were first seen.
+    """
+
+    def __init__(
+        self,
+        graph,
+        chat_messages,
+        session_factory=SessionLocal,
+        flush_interval: float = GRAPH_FLUSH_INTERVAL,
+        batch_size: int = GRAPH_FLUSH_BATCH_SIZE,
+    ):
+        self.graph = graph
+        self.chat_messages = chat_messages
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dirty = set()  # ids of nodes changed since the last flush
+        self.reset = False  # the graph was replaced since the last flush
+        self.positions = {}  # node id -> position column
+        self.next_position = 0
+        self.persisted_messages = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def load(self) -> int:
+        """Restore the stored graph and chat history into the empty in-memory ones. Returns the node count."""
+        ensure_schema(self.session_factory.kw["bind"])
+        with self.session_factory() as db:
+            rows = db.query(models.Node.content, models.Node.position).order_by(models.Node.position).all()
+            messages = db.query(models.ChatMessage).order_by(literal_column("rowid")).all()
+        nodes = [schemas.NodeV2.model_validate(content) for content, _ in rows]
+        self.positions = {node.id: position for node, (_, position) in zip(nodes, rows)}
+        self.next_position = rows[-1][1] + 1 if rows else 0
+        self.chat_messages.extend(
+            schemas.ChatMessage(
+                id=message.id,
+                role=message.role,
+                node_id=message.node_id or "",
+                message=message.message,
+                timestamp=message.timestamp,
+            )
+            for message in messages
+        )
+        self.persisted_messages = len(messages)
+        self.graph.load(nodes, num_messages=len(messages))
+        print(f"[Graph] Restored {len(nodes)} nodes and {len(messages)} chat messages")
+        return len(nodes)
+
+    def notify(self, version, node_id, op=None):
+        with self._lock:
+            if op == ("reset",):
+                self.reset = True
+                self.dirty = set()
+                self.positions = {}
+                self.next_position = 0
+            elif node_id is not None:
+                self.dirty.add(node_id)
+                if node_id not in self.positions:
+                    self.positions[node_id] = self.next_position
+                    self.next_position += 1
+            if len(self.dirty) >= self.batch_size or node_id is None:
+                self._wakeup.set()
+
+    def start(self):
+        self.graph.subscribe(self.notify)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the flush thread and write whatever is still pending."""
+        self.graph.unsubscribe(self.notify)
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Graph] Flush failed, retrying: {e}")
+
+    def flush(self):
+        """Write the nodes changed since the last flush and any new chat messages in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self.dirty = self.dirty, set()
+                reset, self.reset = self.reset, False
+            new_messages = self.chat_messages[self.persisted_messages:]
+            if not dirty and not new_messages and not reset:
+                return
+            try:
+                self._write(dirty, new_messages, reset)
+            except Exception:
+                with self._lock:
+                    self.dirty |= dirty
+                    self.reset = self.reset or reset
+                raise
+            self.persisted_messages += len(new_messages)
+
+    def _write(self, dirty, new_messages, reset=False):
+        node_rows, edge_rows, removed = [], [], []
+        for node_id in dirty:
+            node = self.graph.get(node_id)
+            if node is None:
+                removed.append(node_id)
+                continue
+            node_rows.append({
+                "id": node_id,
+                "node_class": node.type.value,
+                "content": node.model_dump(mode="json"),
+                "position": self.positions[node_id],
+            })
+            edge_rows.extend(
+                {"id": f"{node_id}:{i}", "from_node_id": node_id, "to_node_id": child_id, "position": i}
+                for i, child_id in enumerate(node.children)
+            )
+        with self.session_factory() as db:
+            if reset:
+                db.execute(delete(models.Edge))
+                db.execute(delete(models.Node))
+            for ids in batches(dirty):
+                db.execute(delete(models.Edge).where(models.Edge.from_node_id.in_(ids)))
+            for ids in batches(removed):
+                db.execute(delete(models.Node).where(models.Node.id.in_(ids)))
+            if node_rows:
+                statement = insert(models.Node)
+                db.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["id"],
+                        set_={
+                            "node_class": statement.excluded.node_class,
+                            "content": statement.excluded.content,
+                            "position": statement.excluded.position,
+                        },
+                    ),
+                    node_rows,
+                )
+            if edge_rows:
+                db.execute(insert(models.Edge), edge_rows)
+            if new_messages:
+                db.execute(insert(models.ChatMessage), [
+                    {
+                        "id": message.id,
+                        "role": message.role.value,
+                        "node_id": message.node_id,
+                        "message": message.message,
+                        "timestamp": message.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+                    for message in map(schemas.ChatMessage.model_validate, new_messages)
+                ])
+            db.commit()
@@ -0,0 +1,156 @@
+import os
+import re
+import base64
+import binascii
+import queue
+import shutil
+import threading
+from urllib.parse import unquote_to_bytes
+
+import RAG
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+PREVIEW_CHARACTERS = 300
+TEXT_EXTENSIONS = (".txt", ".md", ".csv", ".json", ".html", ".htm", ".xml")
+
+
+def is_text_mime_type(mime_type: str) -> bool:
+    mime_type = mime_type.split(";", 1)[0].strip().lower()
+    return (
+        mime_type.startswith("text/")
+        or mime_type in ("application/json", "application/xml")
+        or mime_type.endswith(("+json", "+xml"))
+    )
+
+
+def decode_upload_content(content: str, mime_type: str, encoding: str = None) -> bytes:
+    """
+    Uploaded content arrives as a string, in the encoding the client names:
+    a data: URL, encoding="base64", or, for text types only, the text itself.
+    Raises ValueError when the content doesn't match, instead of guessing.
+    """
+    if content.startswith("data:") and "," in content:
+        header, data = content[len("data:") :].split(",", 1)
+        if header.endswith(";base64"):
+            content, encoding = data, "base64"
+        else:
+            return unquote_to_bytes(data)
+    if encoding == "base64":
+        try:
+            return base64.b64decode(content, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Content is not valid base64")
+    if encoding is not None:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    if not is_text_mime_type(mime_type):
+        raise ValueError(f"Binary content ({mime_type}) must be sent base64-encoded or as a data: URL")
+    return content.encode("utf-8")
+
+
+def file_preview(path: str, characters: int = PREVIEW_CHARACTERS) -> str:
+    """Short plain-text preview of a file: the start of a text file or of a PDF's first page."""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        text = reader.pages[0].extract_text() if reader.pages else ""
+    elif path.lower().endswith(TEXT_EXTENSIONS):
+        with open(path, "rb") as f:
+            text = f.read(characters * 4).decode("utf-8", errors="ignore")
+    else:
+        return ""
+    text = re.sub(r"\s+", " ", text).strip()
+    return text[:characters] + ("..." if len(text) > characters else "")
+
+
+class IngestionWorker:
+    """
+    Indexes uploaded files on a background thread, one at a time and in
+    upload order, so the upload request returns immediately.
+
+    Each file is linked (or copied) from its blob to upload_dir/<node
+    id>/<filename>, so partitioning sees the original name, and indexed into
+    the store returned by get_store with RAG.ingest_file. on_preview(node_id,
+    text) receives a short preview first. Progress is reported through
+    on_status(node_id, status): "queued", "partitioning",
+    "indexing <done>/<total> chunks", then "indexed <n> chunks" or "failed: ...".
+    submit() can override these callbacks per file, e.g. for a file that
+    belongs to another workspace, and take an on_done() called when the file
+    has been handled.
+    """
+
+    def __init__(self, get_store, on_status, on_preview=None, upload_dir: str = UPLOAD_DIR):
+        self.get_store = get_store
+        self.on_status = on_status
+        self.on_preview = on_preview
+        self.upload_dir = upload_dir
+        self.jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        node_id: str,
+        filename: str,
+        source_path: str,
+        get_store=None,
+        on_status=None,
+        on_preview=None,
+        on_done=None,
+    ) -> str:
+        """Queue the file at source_path (e.g. a blob) for indexing. Returns the linked path."""
+        # Keep only the base name so an upload can't write outside its directory
+        filename = os.path.basename(filename) or "upload"
+        file_dir = os.path.join(self.upload_dir, node_id)
+        os.makedirs(file_dir, exist_ok=True)
+        path = os.path.join(file_dir, filename)
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(source_path, path)
+        except OSError:
+            shutil.copyfile(source_path, path)
+        callbacks = (
+            get_store or self.get_store,
+            on_status or self.on_status,
+            on_preview or self.on_preview,
+            on_done,
+        )
+        callbacks[1](node_id, "queued")
+        self.jobs.put((node_id, path, callbacks))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return path
+
+    def _run(self):
+        while True:
+            node_id, path, callbacks = self.jobs.get()
+            try:
+                self._ingest(node_id, path, *callbacks[:3])
+            finally:
+                if callbacks[3]:
+                    callbacks[3]()
+                self.jobs.task_done()
+
+    def _ingest(self, node_id, path, get_store, on_status, on_preview):
+        print(f"[Upload] Indexing {path}")
+        try:
+            if on_preview:
+                on_preview(node_id, file_preview(path))
+            store = get_store()
+            on_status(node_id, "partitioning")
+            num_chunks = RAG.ingest_file(
+                path,
+                store,
+                on_progress=lambda done, total: on_status(
+                    node_id, f"indexing {done}/{total} chunks"
+                ),
+                metadata={"node_id": node_id},
+            )
+            on_status(node_id, f"indexed {num_chunks} chunks")
+            print(f"[Upload] Indexed {num_chunks} chunks from {path}")
+        except Exception as e:
+            print(f"[Upload] Failed to index {path}: {e}")
+            on_status(node_id, f"failed: {e}")
@@ -1,15 +1,21 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import models
 from database import engine
+import routes
 from routes import router
 import asyncio
 import threading
 from engine import check_for_replies
-from routes import nodes, RAG_client, RAG_collection
+from routes import nodes, RAG_collection
+from graph_store import GRAPH_PERSIST, GraphStore
+from graph_log import GraphLog
 from RAG import init_rag
-from utils import get_node_by_id
-from engine import init_agent
+from utils import load_exported_nodes
+from engine import init_root
+
+GRAPH_IMPORT_PATH = os.getenv("GRAPH_IMPORT_PATH")  # e.g. demo/nodes.json
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -25,21 +31,42 @@ app.add_middleware(
 
 app.include_router(router)
 
+graph_store = None
+
 
 @app.on_event("startup")
 async def init_rag_at_startup():
-    global nodes, RAG_client, RAG_collection
+    global nodes, RAG_collection, graph_store
     
     """
     Initialize the RAG client, collection, and the root graph node at server startup.
     This will run only once when the FastAPI application starts.
     """
+    if os.getenv("RAG_ENABLED") and routes.RAG_collection is None:
+        # Assign through the module so the routes see the loaded collection
+        routes.RAG_collection = init_rag()
+    if GRAPH_PERSIST != "0" and graph_store is None:
+        # Restore the graph saved by the last run, then keep saving changes
+        if GRAPH_PERSIST == "log":
+            graph_store = GraphLog(nodes, routes.chat_messages)
+        else:
+            graph_store = GraphStore(nodes, routes.chat_messages)
+        graph_store.load()
+        graph_store.start()
+    if not nodes and GRAPH_IMPORT_PATH:
+        # Warm start from an exported graph, without any LLM calls
+        with open(GRAPH_IMPORT_PATH, "r") as f:
+            nodes.replace(load_exported_nodes(f))
+        print(f"[Graph] Imported {len(nodes)} nodes from {GRAPH_IMPORT_PATH}")
     if not nodes:  # Only initialize if nodes isn't already populated
-        # RAG_client, RAG_collection = init_rag()
-        root_node = init_agent(nodes, None)
-        found_node = get_node_by_id(nodes, root_node)
-        found_node.id = "0"
-        found_node.type = "root"
+        init_root(nodes)
+
+
+@app.on_event("shutdown")
+def flush_graph_at_shutdown():
+    routes.workspaces.close()
+    if graph_store is not None:
+        graph_store.close()
 
 # @app.on_event("startup")
 # async def startup_event():
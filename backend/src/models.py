@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON, Integer
 from database import Base
 
 class Node(Base):
@@ -8,16 +8,19 @@ class Node(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     node_class = Column(String, nullable=False)  # e.g., heading, tweet, report, video, etc.
     content = Column(JSON, nullable=False)  # free JSON with metadata
+    position = Column(Integer, nullable=False, default=0)  # order in the graph's node list
 
 class Edge(Base):
     __tablename__ = "edges"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    from_node_id = Column(String, ForeignKey("nodes.id"), nullable=False)
-    to_node_id = Column(String, ForeignKey("nodes.id"), nullable=False)
+    from_node_id = Column(String, ForeignKey("nodes.id"), nullable=False, index=True)
+    to_node_id = Column(String, ForeignKey("nodes.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)  # order among the parent's children
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     role = Column(String, nullable=False)  # "user" or "assistant"
+    node_id = Column(String, nullable=True)
     message = Column(Text, nullable=False)
     timestamp = Column(String, default=lambda: datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+
+QUANTIZATION = os.getenv("RAG_QUANTIZATION", "none")  # "none", "int8" or "pq"
+PQ_SUBVECTORS = int(os.getenv("RAG_PQ_SUBVECTORS", 64))
+PQ_CENTROIDS = 256
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_SAMPLES = 20000
+# Scores are computed over blocks of rows to bound temporary memory
+SCAN_BLOCK_ROWS = 65536
+
+
+def kmeans(data, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Lloyd's k-means over the rows of data (float32). Trains on at most
+    KMEANS_MAX_SAMPLES rows; empty clusters are reseeded from random rows.
+    Returns the (k, dim) centroid matrix.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    if len(data) > KMEANS_MAX_SAMPLES:
+        data = data[rng.choice(len(data), KMEANS_MAX_SAMPLES, replace=False)]
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    data_norms = (data**2).sum(axis=1)
+    for _ in range(iterations):
+        assignments = nearest_centroids(data, centroids, data_norms)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+def nearest_centroids(data, centroids, data_norms=None):
+    """Index of the nearest centroid (squared L2) for every row of data."""
+    if data_norms is None:
+        data_norms = (data**2).sum(axis=1)
+    distances = (
+        data_norms[:, None] - 2 * data @ centroids.T + (centroids**2).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+class ScalarQuantizer:
+    """
+    int8 scalar quantization: each dimension is mapped linearly from its
+    trained [min, max] range onto 256 levels, a 4x reduction over float32.
+    Dot products are estimated straight from the codes, without decoding.
+    """
+
+    kind = "int8"
+    dtype = np.uint8
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.code_size = dim
+        self.low = None
+        self.step = None
+
+    @property
+    def trained(self):
+        return self.low is not None
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        self.step = np.maximum(vectors.max(axis=0) - self.low, 1e-12) / 255
+
+    def encode(self, vectors):
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.step)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def scores(self, codes, query):
+        # x ~= low + step * code, so q.x ~= q.low + (q * step).code
+        weights = (query * self.step).astype(np.float32)
+        offset = float(query @ self.low)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start : start + SCAN_BLOCK_ROWS]
+            out[start : start + len(block)] = block.astype(np.float32) @ weights + offset
+        return out
+
+    def state(self):
+        return {"low": self.low, "step": self.step}
+
+    def load_state(self, state):
+        self.low = state["low"]
+        self.step = state["step"]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: vectors are split into subvectors and each one is
+    replaced by the id of its nearest of 256 k-means centroids, so a vector
+    costs one byte per subvector. Queries score codes with a per-subspace
+    lookup table of query-centroid dot products.
+    """
+
+    kind = "pq"
+    dtype = np.uint8
+
+    def __init__(self, dim, subvectors=PQ_SUBVECTORS):
+        # Use the largest subvector count <= the requested one that divides dim
+        subvectors = min(subvectors, dim)
+        while dim % subvectors:
+            subvectors -= 1
+        self.dim = dim
+        self.subvectors = subvectors
+        self.sub_dim = dim // subvectors
+        self.code_size = subvectors
+        self.centroids = None  # (subvectors, PQ_CENTROIDS, sub_dim)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _split(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.subvectors, self.sub_dim)
+
+    def train(self, vectors):
+        parts = self._split(vectors)
+        centroids = np.zeros((self.subvectors, PQ_CENTROIDS, self.sub_dim), dtype=np.float32)
+        for j in range(self.subvectors):
+            trained = kmeans(parts[:, j], PQ_CENTROIDS, seed=j)
+            centroids[j, : len(trained)] = trained
+            # With fewer training rows than centroids, repeat the last one
+            centroids[j, len(trained) :] = trained[-1]
+        self.centroids = centroids
+
+    def encode(self, vectors):
+        parts = self._split(vectors)
+        codes = np.empty((len(parts), self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            codes[:, j] = nearest_centroids(parts[:, j], self.centroids[j])
+        return codes
+
+    def scores(self, codes, query):
+        lut = np.einsum("mkd,md->mk", self.centroids, self._split(query[None, :])[0])
+        columns = np.arange(self.subvectors)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start : start + SCAN_BLOCK_ROWS]
+            out[start : start + len(block)] = lut[columns, block].sum(axis=1)
+        return out
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    def load_state(self, state):
+        self.centroids = state["centroids"]
+        self.subvectors, _, self.sub_dim = self.centroids.shape
+        self.code_size = self.subvectors
+
+
+def make_quantizer(kind, dim):
+    if kind in (None, "none"):
+        return None
+    if kind == "int8":
+        return ScalarQuantizer(dim)
+    if kind == "pq":
+        return ProductQuantizer(dim)
+    raise ValueError(f"Unknown quantization: {kind}")
@@ -1,45 +1,224 @@
+import io
+import os
+import json
+import re
+import hmac
 import uuid
+import asyncio
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, File, Form, Header, Request, UploadFile, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from typing import List
+from typing import List, Optional
 import schemas
 import engine as processing_engine
 from engine import init_agent, execute_mode_ii, execute_mode_i, process_chat_message
 from database import SessionLocal
-from utils import get_db, get_node_by_id
-from RAG import init_rag
-from external_functions import call_phone_number
+from utils import get_db, get_node_by_id, graph_lock, append_node_content, update_node_children, update_node_content, update_node_status, load_exported_nodes
+from RAG import init_rag, setup_db
+from calls import CALL_AGENT_TOKEN, start_call, touch_call, end_call
+from ingestion import IngestionWorker, decode_upload_content
+from blob_store import BlobStore, parse_range
+from graph import Graph, GraphSnapshot
+from workspaces import DEFAULT_WORKSPACE, Workspace, WorkspaceManager
+import change_feed
 
 router = APIRouter()
 
-nodes = []
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # enables the /admin endpoints, sent as X-Admin-Token
+
+nodes = Graph()
 chat_messages = []
-RAG_client = None
 RAG_collection = None
 
+
+def get_rag_collection():
+    # Uploads open the store on demand, which also enables retrieve in mode I
+    global RAG_collection
+    if RAG_collection is None:
+        RAG_collection = setup_db()
+    return RAG_collection
+
+
+blob_store = BlobStore()
+ingestion_worker = IngestionWorker(
+    get_rag_collection,
+    lambda node_id, status: update_node_status(nodes, node_id, status),
+    on_preview=lambda node_id, preview: update_node_content(nodes, node_id, preview),
+)
+
+# The default workspace is the graph the server has always had
+default_workspace = Workspace(DEFAULT_WORKSPACE, nodes, chat_messages)
+workspaces = WorkspaceManager(default_workspace)
+
+
+def use_workspace(workspace_id: str = Query(DEFAULT_WORKSPACE)):
+    """The workspace a request works on, held in memory until the request ends."""
+    try:
+        workspace = workspaces.acquire(workspace_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        yield workspace
+    finally:
+        workspaces.release(workspace)
+
+
+def hold_workspace(workspace: Workspace):
+    """Keep the workspace in memory past the request; returns the function that lets it go."""
+    workspaces.acquire(workspace.id)
+    return lambda: workspaces.release(workspace)
+
+
+def workspace_rag_collection(workspace: Workspace):
+    """The workspace's vector store collection, opened on first use."""
+    if workspace is default_workspace:
+        return get_rag_collection()
+    with workspace.lock:
+        if workspace.rag_collection is None:
+            workspace.rag_collection = setup_db(name=f"Workspace_{workspace.id}")
+        return workspace.rag_collection
+
+
+def retrieval_collection(workspace: Workspace):
+    """The collection mode I can retrieve from, or None if the workspace has none yet."""
+    if workspace is default_workspace:
+        return RAG_collection
+    if workspace.rag_collection is None and not any(node.type == schemas.NodeType.file for node in workspace.nodes):
+        return None
+    # Reopen the collection of a workspace reloaded from disk
+    return workspace_rag_collection(workspace)
+
+
+def add_file_node(workspace: Workspace, active_node_uuid: str, filename: str, blob: str, mime_type: str, size: int):
+    """
+    Add a file node under the active node. The node holds only a reference to
+    the blob and, once the ingestion worker has read the file, a short
+    preview; the content itself is served by /files/{node_id}/content.
+    """
+    nodes = workspace.nodes
+    active_node = get_node_by_id(nodes, active_node_uuid)
+    if not active_node:
+        raise HTTPException(status_code=404, detail="Active node not found")
+
+    file_node = schemas.NodeV2(
+        id=str(uuid.uuid4()),
+        name=filename,
+        type="file",
+        content="",
+        metadata=schemas.NodeMetadata(
+            source="upload",
+            timestamp=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            blob=blob,
+            mime_type=mime_type,
+            size=size,
+        ),
+        children=[],
+    )
+    nodes.append(file_node)
+    # add file to be a child of the active node
+    update_node_children(nodes, active_node.id, file_node.id)
+    # Index the file in the background; progress shows up in the node's status.
+    # The workspace stays in memory until the worker is done with the file
+    workspaces.acquire(workspace.id)
+    ingestion_worker.submit(
+        file_node.id,
+        filename,
+        blob_store.path(blob),
+        get_store=lambda: workspace_rag_collection(workspace),
+        on_status=lambda node_id, status: update_node_status(nodes, node_id, status),
+        on_preview=lambda node_id, preview: update_node_content(nodes, node_id, preview),
+        on_done=lambda: workspaces.release(workspace),
+    )
+    return file_node
+
+class GraphResponse(Response):
+    """
+    JSON body assembled from pre-serialized fragments. Returning it from a
+    route skips response_model validation, which would re-validate and
+    re-serialize every node; the body still matches schemas.ChatMessageOut.
+    """
+
+    media_type = "application/json"
+
+
+def graph_body(view: GraphSnapshot, node_ids, messages, removed, full) -> bytes:
+    """schemas.ChatMessageOut JSON for the given nodes and chat messages, from cached fragments."""
+    rest = json.dumps(
+        {"version": view.version, "graph_id": view.graph_id, "full": full, "removed": removed}
+    ).encode()
+    # One join over every fragment, so the body is copied only once
+    parts = [b'{"chat_history":[']
+    for i, msg in enumerate(messages):
+        parts.append(b"," if i else b"")
+        parts.append(schemas.ChatMessage.model_validate(msg).model_dump_json().encode())
+    parts.append(b'],"graph":{')
+    for i, node_id in enumerate(node_ids):
+        parts.append(b"," if i else b"")
+        parts.append(view.node_json(node_id))
+    parts.append(b"}," + rest[1:])
+    return b"".join(parts)
+
+
+def changes_body(view: GraphSnapshot, chat_messages, node_ids, since_version) -> bytes:
+    """Delta body: the nodes in node_ids that still exist, the rest as removed."""
+    present = [node_id for node_id in node_ids if view.get(node_id)]
+    removed = sorted(node_id for node_id in node_ids if view.get(node_id) is None)
+    messages = view.messages_since(chat_messages, since_version)
+    return graph_body(view, present, messages, removed, full=False)
+
+
+def graph_output_body(workspace: Workspace, since_version: Optional[int] = None, graph_id: Optional[str] = None):
+    # The body is built from a snapshot, so writers carry on meanwhile and
+    # their changes go out in the next response
+    view = workspace.nodes.snapshot()
+    changed = None if since_version is None else view.changes_since(since_version, graph_id)
+    if changed is None:
+        return view.version, graph_body(
+            view, [node.id for node in view], view.messages(workspace.chat_messages), [], full=True
+        )
+    return view.version, changes_body(view, workspace.chat_messages, changed, since_version)
+
+
+def graph_output(workspace: Workspace, since_version: Optional[int] = None, graph_id: Optional[str] = None):
+    """
+    Response for the graph routes. Clients pass back the version (and
+    graph_id) of the last response as since_version to receive only the
+    nodes added or changed since then, the ids of removed nodes and the new
+    chat messages. Without since_version, or when the change log no longer
+    reaches back to it, the whole graph and chat history are sent.
+    """
+    return GraphResponse(graph_output_body(workspace, since_version, graph_id)[1])
+
+
 @router.post("/start", response_model=schemas.ChatMessageOut)
-def start():
+def start(
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace: Workspace = Depends(use_workspace),
+):
     print("Starting")
-    global nodes
-    global chat_messages
-    global RAG_client
-    global RAG_collection
+    with workspace.lock:
+        if not workspace.nodes:
+            # A new workspace starts from the brief, like the server does
+            processing_engine.init_root(workspace.nodes)
 
     # Simply return the current chat history and graph
-    chat_history = [schemas.ChatMessage.model_validate(msg) for msg in chat_messages]
-    nodes_dict = {node.id: schemas.NodeV2.model_validate(node) for node in nodes}
-    output = schemas.ChatMessageOut(chat_history=chat_history, graph=nodes_dict)
+    output = graph_output(workspace, since_version, graph_id)
     print("Finished Start")
     return output
 
 
 @router.post("/generate", response_model=schemas.ChatMessageOut)
-def generate(payload: schemas.GeneratePayload):
-    global nodes
-    global chat_messages
-    global RAG_collection
+def generate(
+    payload: schemas.GeneratePayload,
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace: Workspace = Depends(use_workspace),
+):
+    nodes = workspace.nodes
     print(nodes)
     active_node = payload.active_node_uuid
     found_node = get_node_by_id(nodes, active_node)
@@ -48,7 +227,7 @@ def generate(payload: schemas.GeneratePayload):
         execute_mode_ii(nodes, active_node)
     elif found_node and found_node.metadata.source == "mode_ii":
         print("Executing mode i")
-        execute_mode_i(nodes, active_node, RAG_collection)
+        execute_mode_i(nodes, active_node, retrieval_collection(workspace), lambda: hold_workspace(workspace))
     elif found_node and found_node.metadata.source == "mode_i":
         if found_node.type == "question":
             pass
@@ -59,92 +238,328 @@ def generate(payload: schemas.GeneratePayload):
     else:
         execute_mode_ii(nodes, active_node)
 
-    # create output object:
-    chat_history = [schemas.ChatMessage.model_validate(msg) for msg in chat_messages]
-    nodes_dict = {node.id: schemas.NodeV2.model_validate(node) for node in nodes}
-    output = schemas.ChatMessageOut(chat_history=chat_history, graph=nodes_dict)
-    return output
+    return graph_output(workspace, since_version, graph_id)
 
 
 @router.post("/chat", response_model=schemas.ChatMessageOut)
-def chat_endpoint(payload: schemas.ChatMessageCreate):
-    global nodes, chat_messages
+def chat_endpoint(
+    payload: schemas.ChatMessageCreate,
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace: Workspace = Depends(use_workspace),
+):
     message = payload.message
     active_node_uuid = payload.node_id
-    process_chat_message(message, active_node_uuid, nodes, chat_messages)
+    process_chat_message(message, active_node_uuid, workspace.nodes, workspace.chat_messages)
     
-    # create output object:
-    chat_history = [schemas.ChatMessage.model_validate(msg) for msg in chat_messages]
-    nodes_dict = {node.id: schemas.NodeV2.model_validate(node) for node in nodes}
-    output = schemas.ChatMessageOut(chat_history=chat_history, graph=nodes_dict)
-    return output
+    return graph_output(workspace, since_version, graph_id)
 
 
 @router.post("/upload", response_model=schemas.ChatMessageOut)
-def upload_endpoint(payload: schemas.FileUpload):
-    global nodes
-    global chat_messages
-    message = payload.message
-    active_node_uuid = payload.active_node_uuid
-    filename = payload.filename
-    content = payload.content
-    mime_type = payload.mime_type
-    size = payload.size
+def upload_endpoint(
+    payload: schemas.FileUpload,
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace: Workspace = Depends(use_workspace),
+):
+    """
+    JSON upload with the whole file in payload.content. Prefer /upload/file,
+    which streams the file instead of holding it in memory.
+    """
+    try:
+        data = decode_upload_content(payload.content, payload.mime_type, payload.encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if get_node_by_id(workspace.nodes, payload.active_node_uuid) is None:
+        raise HTTPException(status_code=404, detail="Active node not found")
+    blob, size = blob_store.write_bytes(data)
+    add_file_node(workspace, payload.active_node_uuid, payload.filename, blob, payload.mime_type, size)
+
+    return graph_output(workspace, since_version, graph_id)
+
+
+@router.post("/upload/file", response_model=schemas.ChatMessageOut)
+def upload_file_endpoint(
+    active_node_uuid: str = Form(...),
+    message: str = Form(""),
+    file: UploadFile = File(...),
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace: Workspace = Depends(use_workspace),
+):
+    """
+    Multipart upload. The file is read in 1 MB pieces straight into the blob
+    store (identical files are stored once) and the new file node holds a
+    reference to it rather than the content.
+    """
+    if get_node_by_id(workspace.nodes, active_node_uuid) is None:
+        raise HTTPException(status_code=404, detail="Active node not found")
+    blob, size = blob_store.write_file(file.file)
+    mime_type = file.content_type or "application/octet-stream"
+    add_file_node(workspace, active_node_uuid, file.filename or "upload", blob, mime_type, size)
+
+    return graph_output(workspace, since_version, graph_id)
+
+
+@router.get("/graph/nodes", response_model=schemas.NodePage)
+def list_nodes(
+    type: Optional[schemas.NodeType] = None,
+    source: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    workspace: Workspace = Depends(use_workspace),
+):
+    """
+    Content-free summaries of the nodes in creation order, optionally only
+    those of one type or source. Pages are found by position, so reading a
+    page scans only from offset to the last match returned.
+    """
+    nodes = workspace.nodes.snapshot()
+    version = nodes.version
+    summaries = []
+    position = offset
+    while position < len(nodes) and len(summaries) < limit:
+        node = nodes[position]
+        position += 1
+        if (type is None or node.type == type) and (source is None or node.metadata.source == source):
+            summaries.append(
+                schemas.NodeSummary(
+                    id=node.id,
+                    name=node.name,
+                    type=node.type,
+                    source=node.metadata.source,
+                    timestamp=node.metadata.timestamp,
+                    status=node.metadata.status,
+                    num_children=len(node.children),
+                )
+            )
+    return schemas.NodePage(
+        nodes=summaries, next_offset=position if position < len(nodes) else None, version=version
+    )
 
-    # create file node (need to add to rag db)
-    file_node = schemas.NodeV2(
-        id=str(uuid.uuid4()),
-        name=filename,
-        type="file",
-        content=content,
-        metadata=schemas.NodeMetadata(
-            source="upload",
-            timestamp=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-        ),
-        children=[],
+
+@router.get("/graph/nodes/{node_id}", response_model=schemas.NodeV2)
+def get_node(node_id: str, workspace: Workspace = Depends(use_workspace)):
+    node = workspace.nodes.get(node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    fragment = workspace.nodes.fragment(node)
+    # Drop the '"<id>":' prefix of the cached member
+    return GraphResponse(fragment[len(json.dumps(node_id).encode()) + 1:])
+
+
+@router.get("/graph/nodes/{node_id}/subtree", response_model=schemas.Subtree)
+def get_subtree(
+    node_id: str,
+    depth: int = Query(2, ge=0),
+    limit: int = Query(200, ge=1, le=5000),
+    workspace: Workspace = Depends(use_workspace),
+):
+    """
+    The node and its descendants down to depth levels (0: just the node),
+    breadth-first and at most limit nodes, so a client can load the branches
+    a user expands. Children left out are still listed in their parents'
+    children.
+    """
+    nodes = workspace.nodes.snapshot()
+    if nodes.get(node_id) is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    version = nodes.version
+    subtree = [node_id]
+    seen = {node_id}
+    level = [node_id]
+    truncated = False
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for child_id in nodes.get(parent_id).children:
+                if child_id in seen or nodes.get(child_id) is None:
+                    continue
+                if len(subtree) == limit:
+                    truncated = True
+                    break
+                seen.add(child_id)
+                subtree.append(child_id)
+                next_level.append(child_id)
+            if truncated:
+                break
+        level = next_level
+        if truncated or not level:
+            break
+    else:
+        # Reached depth: anything below the last level is cut off
+        truncated = any(
+            child_id not in seen for parent_id in level for child_id in nodes.get(parent_id).children
+        )
+    rest = json.dumps({"truncated": truncated, "version": version, "graph_id": nodes.graph_id}).encode()
+    return GraphResponse(
+        b'{"root":' + json.dumps(node_id).encode() + b',"graph":{'
+        + b",".join(nodes.node_json(child_id) for child_id in subtree)
+        + b"}," + rest[1:]
     )
-    # add file to be a child of the active node
-    active_node = get_node_by_id(nodes, active_node_uuid)
-    if active_node:
-        active_node.children.append(file_node)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are off unless ADMIN_TOKEN is set, and then need it in X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.post("/admin/graph/import", dependencies=[Depends(require_admin)])
+def import_graph_endpoint(
+    file: Optional[UploadFile] = File(None),
+    path: Optional[str] = Form(None),
+    workspace: Workspace = Depends(use_workspace),
+):
+    """
+    Replace the graph with an exported one ({id: node}, as utils.export_nodes
+    writes), either uploaded as file or read from path under the server's
+    working directory. The file is parsed as a stream, one node at a time.
+    Connected clients are sent the new graph.
+    """
+    if file is not None:
+        f = io.TextIOWrapper(file.file, encoding="utf-8")
+    elif path:
+        full_path = os.path.realpath(path)
+        if os.path.commonpath([full_path, os.getcwd()]) != os.getcwd() or not os.path.isfile(full_path):
+            raise HTTPException(status_code=404, detail="Export file not found")
+        f = open(full_path, "r", encoding="utf-8")
     else:
-        raise HTTPException(status_code=404, detail="Active node not found")
+        raise HTTPException(status_code=400, detail="Provide an exported graph file or path")
+    try:
+        loaded = load_exported_nodes(f)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid exported graph: {e}")
+    finally:
+        f.close()
+    nodes = workspace.nodes
+    nodes.replace(loaded)
+    print(f"[Graph] Imported {len(nodes)} nodes into workspace {workspace.id}")
+    return {"status": "ok", "nodes": len(nodes), "version": nodes.version}
+
+
+@router.get("/files/{node_id}/content")
+def file_content_endpoint(node_id: str, request: Request, workspace: Workspace = Depends(use_workspace)):
+    """
+    Serves a file node's content from the blob store, honouring single
+    byte-range requests (Range: bytes=start-end) with 206 responses.
+    """
+    node = get_node_by_id(workspace.nodes, node_id)
+    if node is None or not node.metadata.blob:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = blob_store.size(node.metadata.blob)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(node.name)}",
+    }
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.read_range(node.metadata.blob, start, end),
+        status_code=status_code,
+        media_type=node.metadata.mime_type or "application/octet-stream",
+        headers=headers,
+    )
 
-    # create output object:
-    chat_history = [schemas.ChatMessage.model_validate(msg) for msg in chat_messages]
-    nodes_dict = {node.id: schemas.NodeV2.model_validate(node) for node in nodes}
-    output = schemas.ChatMessageOut(chat_history=chat_history, graph=nodes_dict)
-    return output
+
+@router.websocket("/ws/graph")
+async def graph_feed(
+    websocket: WebSocket,
+    since_version: Optional[int] = None,
+    graph_id: Optional[str] = None,
+    workspace_id: str = DEFAULT_WORKSPACE,
+):
+    """
+    Pushes graph changes as they happen, including those made in the
+    background (call results, ingestion progress, email replies). The first
+    message brings the client up to date from since_version (a full snapshot
+    without it); each later one is a delta in the same format as the graph
+    routes, covering every change since the previous message.
+    """
+    await websocket.accept()
+    try:
+        # Loading the workspace may read it from disk
+        workspace = await asyncio.to_thread(workspaces.acquire, workspace_id)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    nodes = workspace.nodes
+    subscriber = change_feed.subscribe(nodes, asyncio.get_running_loop())
+    receiver = asyncio.create_task(wait_for_disconnect(websocket, subscriber))
+    try:
+        version, body = graph_output_body(workspace, since_version, graph_id)
+        await websocket.send_text(body.decode())
+        while True:
+            await subscriber.wait()
+            if subscriber.closed:
+                break
+            # Take the flag before the snapshot, so every change it was set
+            # for is in the snapshot: either in this message or already sent
+            if not subscriber.take():
+                continue
+            # The delta since the last message, or the graph if the client
+            # fell more than the change log's length behind
+            sent_version = version
+            version, body = graph_output_body(workspace, sent_version, nodes.graph_id)
+            if version == sent_version:
+                continue  # already sent with the previous message
+            await websocket.send_text(body.decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        change_feed.unsubscribe(nodes, subscriber)
+        receiver.cancel()
+        workspaces.release(workspace)
+
+
+async def wait_for_disconnect(websocket: WebSocket, subscriber):
+    # Clients don't send anything, but reading is how a disconnect is noticed
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscriber.close()
 
 
 @router.get("/phonecall/{phone_number}")
-def phonecall_endpoint(phone_number: str, background_tasks: BackgroundTasks):
-    # Start the phone call in a non-blocking way
+def phonecall_endpoint(
+    phone_number: str,
+    background_tasks: BackgroundTasks,
+    topic: str = "",
+    workspace: Workspace = Depends(use_workspace),
+):
+    nodes = workspace.nodes
+    # Create the call node up front so live transcript batches have a target
     id_to_update = str(uuid.uuid4())
+    call_node = schemas.NodeV2(
+        id=id_to_update,
+        name=f"Phone call to {phone_number}",
+        type="call",
+        content="",
+        metadata=schemas.NodeMetadata(
+            source="phone_call",
+            timestamp=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        ),
+        children=[],
+    )
+    nodes.append(call_node)
+    print(f"[Phone Call] Added call node to nodes: {id_to_update}")
 
-    # Create a background task to handle the call result and update nodes
-    def process_call_result(phone_number: str):
-        global nodes
-        print(f"[Phone Call] Processing call result for {phone_number}")
-        call_result = call_phone_number(phone_number)
-        print(f"[Phone Call] Call result: {call_result}")
-        # Create a new node for the phone call
-        call_node = schemas.NodeV2(
-            id=id_to_update,
-            name=f"Phone call to {phone_number}",
-            type="call",
-            content=call_result,
-            metadata=schemas.NodeMetadata(
-                source="phone_call",
-                timestamp=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-            ),
-            children=[],
-        )
-        nodes.append(call_node)
-        print(f"[Phone Call] Added call node to nodes: {id_to_update}")
-
-    # Add the task to background_tasks
-    background_tasks.add_task(process_call_result, phone_number)
+    # Dial in the background, keeping the workspace in memory until the
+    # phone agent reports that the call has ended
+    background_tasks.add_task(start_call, nodes, id_to_update, phone_number, topic, hold_workspace(workspace))
 
     return {
         "status": "Call initiated",
@@ -153,6 +568,61 @@ def phonecall_endpoint(phone_number: str, background_tasks: BackgroundTasks):
     }
 
 
+TRANSCRIPT_HEADER_PATTERN = re.compile(r"\n\n(\w+): ")
+
+
+def last_speaker(content: str):
+    """The role of the last transcript line in a call node's content, or None."""
+    match = TRANSCRIPT_HEADER_PATTERN.match(content, max(content.rfind("\n\n"), 0))
+    return match.group(1).lower() if match else None
+
+
+def require_call_agent(x_call_token: Optional[str] = Header(None)):
+    """Transcript posts are off unless CALL_AGENT_TOKEN is set, and then need it in X-Call-Token."""
+    if not CALL_AGENT_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_call_token is None or not hmac.compare_digest(x_call_token, CALL_AGENT_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid call agent token")
+
+
+@router.post("/calls/{node_id}/transcript", dependencies=[Depends(require_call_agent)])
+def call_transcript_endpoint(node_id: str, payload: schemas.TranscriptUpdate):
+    """
+    Receives a batch of live transcript lines from the phone agent and appends
+    them to the call node, continuing the previous line if the speaker is unchanged.
+    The call node is looked up in every workspace in memory, which includes
+    the one the call was made from: start_call holds it until the agent's
+    last batch (ended) or the call's idle timeout.
+    """
+    workspace = workspaces.acquire_by_node(node_id)
+    if workspace is None:
+        raise HTTPException(status_code=404, detail="Call node not found")
+
+    try:
+        # Batches can arrive concurrently; the speaker check and the append must not interleave
+        with graph_lock(workspace.nodes):
+            node = get_node_by_id(workspace.nodes, node_id)
+            if node.type != schemas.NodeType.call:
+                raise HTTPException(status_code=409, detail="Not a call node")
+            role = last_speaker(node.content)
+            text = ""
+            for line in payload.lines:
+                if role == line.role:
+                    text += line.text
+                else:
+                    text += f"\n\n{line.role.capitalize()}: {line.text}"
+                    role = line.role
+            if text:
+                append_node_content(workspace.nodes, node_id, text)
+    finally:
+        workspaces.release(workspace)
+    if payload.ended:
+        end_call(node_id)
+    else:
+        touch_call(node_id)
+    return {"status": "ok", "node_id": node_id}
+
+
 # @router.post("/chat", response_model=schemas.ChatMessageOut)
 # def chat_endpoint(payload: schemas.ChatMessageCreate, db: Session = Depends(get_db)):
 #     """
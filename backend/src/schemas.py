@@ -1,6 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from enum import Enum
 
 
@@ -21,6 +21,10 @@ class NodeType(str, Enum):  # to be displayed differently in the UI
 class NodeMetadata(BaseModel):
     source: str
     timestamp: str  # Changed from datetime to str
+    status: Optional[str] = None  # progress of background work, e.g. indexing an upload
+    blob: Optional[str] = None  # sha256 of the file content in the blob store, for file nodes
+    mime_type: Optional[str] = None
+    size: Optional[int] = None  # file size in bytes
 
 
 class NodeV2(BaseModel):
@@ -58,6 +62,33 @@ class ChatMessage(ChatMessageBase):
 class ChatMessageOut(BaseModel):
     chat_history: List[ChatMessage]
     graph: Dict[str, NodeV2]
+    version: int = 0  # graph version this response brings the client up to
+    graph_id: Optional[str] = None  # identifies the graph the version belongs to
+    full: bool = True  # False when graph and chat_history hold only changes since since_version
+    removed: List[str] = []  # ids of nodes removed since since_version
+
+class NodeSummary(BaseModel):
+    id: str
+    name: str
+    type: NodeType
+    source: str
+    timestamp: str
+    status: Optional[str] = None
+    num_children: int
+
+
+class NodePage(BaseModel):
+    nodes: List[NodeSummary]
+    next_offset: Optional[int] = None  # pass as offset for the next page; None on the last page
+    version: int
+
+
+class Subtree(BaseModel):
+    root: str
+    graph: Dict[str, NodeV2]
+    truncated: bool  # True when depth or limit cut off descendants
+    version: int
+    graph_id: str
 
 class FileUpload(BaseModel):
     message: str
@@ -66,6 +97,15 @@ class FileUpload(BaseModel):
     content: str
     mime_type: str
     size: int  # file size in bytes
+    encoding: Optional[str] = None  # "base64" for binary content, unless content is a data: URL
 
 class GeneratePayload(BaseModel):
     active_node_uuid: str
+
+class TranscriptLine(BaseModel):
+    role: str  # "caller" or "assistant"
+    text: str
+
+class TranscriptUpdate(BaseModel):
+    lines: List[TranscriptLine]
+    ended: bool = False  # the agent's last batch for the call
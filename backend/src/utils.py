@@ -1,5 +1,6 @@
 import uuid
 import json
+from contextlib import nullcontext
 from fastapi import Depends
 from sqlalchemy.orm import Session
 
@@ -7,6 +8,9 @@ import models
 import schemas
 from datetime import datetime
 from database import SessionLocal
+from graph import Graph
+
+EXPORT_READ_SIZE = 1 << 20
 
 def get_db():
     db = SessionLocal()
@@ -46,15 +50,71 @@ def create_node(nodes: list[schemas.NodeV2], name: str, type: str, content: str,
     ))
     return node_id
 
+def graph_lock(nodes: list[schemas.NodeV2]):
+    # Versioned graphs serialize their writers; plain node lists have one
+    return nodes.lock if isinstance(nodes, Graph) else nullcontext()
+
+def change_node(nodes: list[schemas.NodeV2], node_id: str, op=None, **fields) -> schemas.NodeV2:
+    # Versioned graphs swap in a changed copy, so snapshots being read keep
+    # the node as it was, send it to clients as a delta and log op
+    if isinstance(nodes, Graph):
+        return nodes.update(node_id, op, **fields)
+    node = get_node_by_id(nodes, node_id)
+    if node:
+        for name, value in fields.items():
+            setattr(node, name, value)
+    return node
+
 def update_node_children(nodes: list[schemas.NodeV2], parent_id: str, child_id: str) -> None:
-    for node in nodes:
-        if node.id == parent_id:
-            node.children.append(child_id)
-            break
+    with graph_lock(nodes):
+        node = get_node_by_id(nodes, parent_id)
+        if node:
+            change_node(nodes, parent_id, ("link", child_id), children=node.children + [child_id])
+
+def update_node_content(nodes: list[schemas.NodeV2], node_id: str, content: str) -> schemas.NodeV2:
+    return change_node(nodes, node_id, ("content", content), content=content)
+
+def append_node_content(nodes: list[schemas.NodeV2], node_id: str, text: str) -> schemas.NodeV2:
+    with graph_lock(nodes):
+        node = get_node_by_id(nodes, node_id)
+        if node:
+            offset = len(node.content)
+            node = change_node(nodes, node_id, ("append", text, offset), content=node.content + text)
+        return node
+
+def prepend_node_content(nodes: list[schemas.NodeV2], node_id: str, text: str) -> schemas.NodeV2:
+    # e.g. a call's result ahead of the transcript still being appended to it
+    with graph_lock(nodes):
+        node = get_node_by_id(nodes, node_id)
+        if node:
+            node = update_node_content(nodes, node_id, text + node.content)
+        return node
+
+def update_node_status(nodes: list[schemas.NodeV2], node_id: str, status: str) -> schemas.NodeV2:
+    with graph_lock(nodes):
+        node = get_node_by_id(nodes, node_id)
+        if node:
+            metadata = node.metadata.model_copy(update={"status": status})
+            node = change_node(nodes, node_id, ("status", status), metadata=metadata)
+        return node
+
+def rename_node(nodes: list[schemas.NodeV2], node_id: str, new_id: str) -> schemas.NodeV2:
+    if isinstance(nodes, Graph):
+        return nodes.rename(node_id, new_id)
+    node = get_node_by_id(nodes, node_id)
+    node.id = new_id
+    return node
+
+def add_chat_message(nodes: list[schemas.NodeV2], chat_messages: list, message) -> None:
+    with graph_lock(nodes):
+        chat_messages.append(message)
+        if isinstance(nodes, Graph):
+            nodes.record_message(message)
 
 def get_node_by_id(nodes: list[schemas.NodeV2], node_id: str) -> schemas.NodeV2:
+    if isinstance(nodes, Graph):
+        return nodes.get(node_id)
     for node in nodes:
-        print(node.id, node_id)
         if node.id == node_id:
             return node
     return None
@@ -71,6 +131,80 @@ def export_nodes(nodes: list[schemas.NodeV2], file_path: str) -> None:
     with open(file_path, 'w') as f:
         json.dump({node.id: node.model_dump() for node in nodes}, f, indent=2)
 
+def iter_exported_nodes(f, read_size: int = EXPORT_READ_SIZE):
+    """
+    Yield the (id, node dict) pairs of a {id: node} JSON object, as written
+    by export_nodes, from text file f. The file is read in read_size pieces
+    and each node decoded as soon as it is complete, so only one node and
+    one piece are held as text at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = "", 0
+
+    def read_more():
+        nonlocal buffer, position
+        chunk = f.read(read_size)
+        if not chunk:
+            return False
+        buffer, position = buffer[position:] + chunk, 0
+        return True
+
+    def next_char(expected):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or not read_more():
+                break
+        if position >= len(buffer) or buffer[position] not in expected:
+            raise ValueError(f"Expected one of {expected!r} at offset {position} of the exported graph")
+        position += 1
+        return buffer[position - 1]
+
+    def next_value():
+        nonlocal position
+        while True:
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+                return value
+            except json.JSONDecodeError:
+                # Incomplete value: read on until it is whole
+                if not read_more():
+                    raise
+
+    next_char("{")
+    if next_char('"}') == "}":
+        return
+    position -= 1
+    while True:
+        node_id = next_value()
+        next_char(":")
+        next_char("{")
+        position -= 1
+        yield node_id, next_value()
+        if next_char(",}") == "}":
+            return
+        next_char('"')
+        position -= 1
+
+def load_exported_nodes(f) -> list[schemas.NodeV2]:
+    """
+    Nodes of an exported graph, validated as they are parsed. The root keeps
+    (or is given) the id "0" that the routes and frontend treat as the root.
+    """
+    loaded = []
+    root_id = None
+    for node_id, node in iter_exported_nodes(f):
+        node.setdefault("id", node_id)
+        node = schemas.NodeV2.model_validate(node)
+        if root_id is None and node.type == schemas.NodeType.root:
+            root_id = node.id
+            node.id = "0"
+        elif root_id is not None and root_id in node.children:
+            node.children = ["0" if child_id == root_id else child_id for child_id in node.children]
+        loaded.append(node)
+    return loaded
+
 def get_ancestor_content(nodes: list[schemas.NodeV2], node_id: str) -> str:
     # Get all ancestor content by doing BFS from root to target node
     visited = set()
@@ -114,13 +248,18 @@ DO NOT CALL MORE THAN ONE PERSON BECAUSE PEOPLE ARE BUSY.
 CREATE AT LEAST FIVE TOOL CALLS IN YOUR OUTPUT.
 IN EMAILS, SEND REQUESTS FOR INFORMATION, NOT FOR CONVERSATIONS.
 """
-# You have access to the following tools:
-# [ask, search, retrieve, email, phone]
-# - ask is used to ask a question to the user.
-# - search uses Perplexity to search the internet for relevant information.
-# - retrieve uses a retrieval-augmented generation workflow to retrieve information from proprietary data.
-# - email is used to send an email to a given recipient with a subject and message.
-# - phone is used to call a given individual using a separate phone AI agent.
+# Used instead of mode_i when a RAG collection is loaded
+mode_i_retrieve = mode_i.replace(
+    """[ask, search, email, phone]
+- ask is used to ask a question to the user.
+- search uses Perplexity to search the internet for relevant information.
+""",
+    """[ask, search, retrieve, email, phone]
+- ask is used to ask a question to the user.
+- search uses Perplexity to search the internet for relevant information.
+- retrieve uses a retrieval-augmented generation workflow to retrieve information from proprietary data.
+""",
+)
 
 mode_ii = """
 You are an investigative journalist's research agent.
@@ -0,0 +1,741 @@
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+from bm25 import BM25Index
+from embeddings import EMBEDDING_PROVIDER, make_provider, provider_name
+from ann import ANN_INDEX, IVF_RETRAIN_GROWTH, IVF_TRAIN_ROWS, IVFIndex
+from quantization import QUANTIZATION, SCAN_BLOCK_ROWS, make_quantizer
+
+VECTOR_STORE_BACKEND = os.getenv("RAG_VECTOR_STORE", "weaviate")
+LOCAL_STORE_DIR = os.getenv("RAG_LOCAL_STORE_DIR", "./vector_store")
+INITIAL_CAPACITY = 1024
+# Quantized stores train once this many rows exist and rerank this many candidates
+QUANTIZATION_TRAIN_ROWS = int(os.getenv("RAG_QUANTIZATION_TRAIN_ROWS", 1000))
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", 100))
+# Deleted rows are only marked; the store is rewritten once this share of its rows is dead
+COMPACTION_DEAD_RATIO = float(os.getenv("RAG_COMPACTION_DEAD_RATIO", 0.3))
+
+
+class VectorStore:
+    """
+    Storage interface behind RAG ingestion and retrieval.
+
+    Chunks are added as (properties, vector) pairs, where properties is the
+    metadata dict built in RAG.chunk_records. Queries return hits as
+    {"id": ..., "properties": ..., "distance": ...} dicts ordered by cosine
+    distance, optionally restricted to a filename and/or page number.
+    keyword_query ranks chunks by BM25 over their text instead and reports
+    a "score" in place of the distance.
+
+    open_store sets embedder to the collection's EmbeddingProvider; the
+    provider name is recorded with the collection so its vectors are never
+    mixed with another provider's.
+    """
+
+    embedder = None
+
+    def recorded_embedding_provider(self):
+        return None
+
+    def record_embedding_provider(self, name: str):
+        pass
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def add(self, properties, vectors):
+        raise NotImplementedError
+
+    def delete_file(self, filename: str):
+        raise NotImplementedError
+
+    def query(self, vector, limit: int = 5, filename: str = None, page_number: int = None, **kwargs):
+        raise NotImplementedError
+
+    def keyword_query(self, text: str, limit: int = 5, filename: str = None, page_number: int = None):
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist anything buffered in memory; called at the end of ingestion."""
+        pass
+
+    def close(self):
+        pass
+
+
+class WeaviateStore(VectorStore):
+    def __init__(self, client, collection):
+        self.client = client
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.aggregate.over_all(total_count=True).total_count
+
+    def add(self, properties, vectors):
+        from weaviate.classes.data import DataObject
+
+        response = self.collection.data.insert_many(
+            [
+                DataObject(properties=props, vector=list(map(float, vector)))
+                for props, vector in zip(properties, vectors)
+            ]
+        )
+        if response.has_errors:
+            raise RuntimeError(f"Failed to insert chunks: {response.errors}")
+
+    def delete_file(self, filename: str):
+        from weaviate.classes.query import Filter
+
+        self.collection.data.delete_many(
+            where=Filter.by_property("filename").equal(filename)
+        )
+
+    def _filters(self, filename=None, page_number=None):
+        from weaviate.classes.query import Filter
+
+        filters = []
+        if filename is not None:
+            filters.append(Filter.by_property("filename").equal(filename))
+        if page_number is not None:
+            filters.append(Filter.by_property("page_number").equal(page_number))
+        return Filter.all_of(filters) if filters else None
+
+    def query(self, vector, limit: int = 5, filename: str = None, page_number: int = None, **kwargs):
+        from weaviate.classes.query import MetadataQuery
+
+        response = self.collection.query.near_vector(
+            near_vector=list(map(float, vector)),
+            limit=limit,
+            filters=self._filters(filename, page_number),
+            return_metadata=MetadataQuery(distance=True),
+        )
+        return [
+            {"id": str(o.uuid), "properties": o.properties, "distance": o.metadata.distance}
+            for o in response.objects
+        ]
+
+    def keyword_query(self, text: str, limit: int = 5, filename: str = None, page_number: int = None):
+        from weaviate.classes.query import MetadataQuery
+
+        response = self.collection.query.bm25(
+            query=text,
+            query_properties=["text"],
+            limit=limit,
+            filters=self._filters(filename, page_number),
+            return_metadata=MetadataQuery(score=True),
+        )
+        return [
+            {"id": str(o.uuid), "properties": o.properties, "score": o.metadata.score}
+            for o in response.objects
+        ]
+
+    def recorded_embedding_provider(self):
+        description = self.collection.config.get().description or ""
+        if description.startswith("embedding_provider="):
+            return description.split("=", 1)[1]
+        return None
+
+    def record_embedding_provider(self, name: str):
+        self.collection.config.update(description=f"embedding_provider={name}")
+
+    def close(self):
+        self.client.close()
+
+
+class LocalStore(VectorStore):
+    """
+    In-process vector store for small and medium corpora.
+
+    Unit-normalized vectors are kept in a memory-mapped float32 matrix
+    (vectors.f32), one row per chunk, and chunk metadata in SQLite
+    (metadata.sqlite). Filter columns and the live-row mask are mirrored in
+    NumPy arrays so a query is one matmul over the matrix plus argpartition,
+    with no per-row Python work.
+
+    With quantization ("int8" or "pq"), compact codes are kept in codes.bin
+    once enough rows exist to train the quantizer. Queries then scan only the
+    codes and rerank the best RERANK_CANDIDATES rows exactly against the
+    full-precision matrix, so just those rows of vectors.f32 are paged in.
+
+    A BM25Index over the chunk text is maintained next to the vectors for
+    keyword_query.
+
+    With ann="ivf", an IVFIndex restricts each query to the rows in the
+    closest nprobe inverted lists; quantization and reranking then apply to
+    those candidates only. Until the index is trained, queries scan everything.
+
+    delete_file() only marks rows deleted. Once COMPACTION_DEAD_RATIO of the
+    rows are dead, compact() rewrites the vectors, codes, IVF lists, BM25
+    postings and metadata without them. Queries run without the lock, so
+    _generation is bumped when compaction starts and ends, and a query that
+    overlapped one is run again.
+    """
+
+    def __init__(
+        self,
+        name: str = "demo",
+        dir: str = LOCAL_STORE_DIR,
+        quantization: str = QUANTIZATION,
+        ann: str = ANN_INDEX,
+    ):
+        self.dir = os.path.join(dir, name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.codes_path = os.path.join(self.dir, "codes.bin")
+        self.quantizer_path = os.path.join(self.dir, "quantizer.npz")
+        self.quantization = quantization
+        self.index = IVFIndex(self.dir) if ann == "ivf" else None
+        self.bm25 = BM25Index(self.dir)
+        self.lock = threading.Lock()
+        self._index_training = None  # thread training the IVF index
+        self._generation = 0  # odd while compact() is renumbering rows
+        self.db = sqlite3.connect(
+            os.path.join(self.dir, "metadata.sqlite"), check_same_thread=False
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, filename TEXT, page_number INTEGER,"
+            " properties TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS chunks_filename ON chunks (filename)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.db.commit()
+
+        self.dim = None
+        self.capacity = 0
+        self.num_rows = 0
+        self.file_ids = {}  # filename -> small int used in the file_id column
+        self.quantizer = None
+        self._vectors = None
+        self._codes = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._file_id = np.zeros(0, dtype=np.int32)
+        self._page = np.zeros(0, dtype=np.int32)
+        self._load()
+
+    def _load(self):
+        row = self.db.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        if row is None:
+            return
+        self.dim = int(row[0])
+        pending = self.db.execute("SELECT value FROM info WHERE key = 'compaction'").fetchone()
+        if pending is not None:
+            # Finish a compaction interrupted after its metadata was committed
+            for tmp_path, path in json.loads(pending[0]):
+                if os.path.exists(tmp_path):
+                    os.replace(tmp_path, path)
+            self.db.execute("DELETE FROM info WHERE key = 'compaction'")
+            self.db.commit()
+        self.capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+        )
+        self._resize_columns(self.capacity)
+        # Rebuild the filter columns with a single read of the metadata table
+        for row, filename, page_number, deleted in self.db.execute(
+            "SELECT row, filename, page_number, deleted FROM chunks"
+        ):
+            self._alive[row] = not deleted
+            self._file_id[row] = self._file_id_for(filename)
+            self._page[row] = page_number if page_number is not None else -1
+            self.num_rows = max(self.num_rows, row + 1)
+
+        self.quantizer = make_quantizer(self.quantization, self.dim)
+        if self.quantizer and os.path.exists(self.quantizer_path):
+            with np.load(self.quantizer_path) as saved:
+                if str(saved["kind"]) == self.quantizer.kind:
+                    self.quantizer.load_state(saved)
+                    self._open_codes()
+        if self.quantizer and not self.quantizer.trained:
+            self._train_quantizer()
+
+        if self.index is not None:
+            self.index.resize(self.capacity)
+            self.index.load(self.num_rows)
+            self._maybe_train_index()
+
+        # Restore the keyword index and catch up on rows added after its snapshot
+        self.bm25.load()
+        if self.bm25.num_rows > self.num_rows:
+            self.bm25 = BM25Index(self.dir)
+        for row, properties in self.db.execute(
+            "SELECT row, properties FROM chunks WHERE row >= ? ORDER BY row",
+            (self.bm25.num_rows,),
+        ):
+            self.bm25.add(row, [json.loads(properties).get("text")])
+        self.bm25.delete(np.flatnonzero(~self._alive[: self.num_rows]).tolist())
+
+    def _file_id_for(self, filename):
+        if filename not in self.file_ids:
+            self.file_ids[filename] = len(self.file_ids)
+        return self.file_ids[filename]
+
+    def _resize_columns(self, capacity):
+        for name in ("_alive", "_file_id", "_page"):
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=column.dtype)
+            resized[: len(column)] = column[:capacity]
+            setattr(self, name, resized)
+
+    def _open_codes(self):
+        if self._codes is not None:
+            self._codes.flush()
+        with open(self.codes_path, "ab") as f:
+            f.truncate(self.capacity * self.quantizer.code_size)
+        self._codes = np.memmap(
+            self.codes_path,
+            dtype=self.quantizer.dtype,
+            mode="r+",
+            shape=(self.capacity, self.quantizer.code_size),
+        )
+
+    def _grow(self, min_capacity):
+        capacity = max(self.capacity * 2, min_capacity, INITIAL_CAPACITY)
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self._resize_columns(capacity)
+        self.capacity = capacity
+        if self._codes is not None:
+            self._open_codes()
+        if self.index is not None:
+            self.index.resize(capacity)
+
+    def _train_quantizer(self):
+        """
+        Train the quantizer on the live rows once there are enough of them,
+        then encode every existing row. Until then queries scan exactly.
+        """
+        live = np.flatnonzero(self._alive[: self.num_rows])
+        if len(live) < QUANTIZATION_TRAIN_ROWS:
+            return
+        self.quantizer.train(self._vectors[live])
+        np.savez(self.quantizer_path, kind=self.quantizer.kind, **self.quantizer.state())
+        self._open_codes()
+        for start in range(0, self.num_rows, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, self.num_rows)
+            self._codes[start:end] = self.quantizer.encode(self._vectors[start:end])
+        self._codes.flush()
+
+    def _maybe_train_index(self):
+        """
+        Train the IVF centroids once IVF_TRAIN_ROWS live rows exist, and
+        retrain when the store has outgrown the data they were trained on.
+        Training runs on a background thread; until it is done, queries use
+        the previous centroids (or scan everything) and adds carry on.
+        """
+        if self._index_training is not None and self._index_training.is_alive():
+            return
+        live = np.flatnonzero(self._alive[: self.num_rows])
+        if len(live) < IVF_TRAIN_ROWS:
+            return
+        if self.index.trained and len(live) < IVF_RETRAIN_GROWTH * self.index.trained_rows:
+            return
+        self._index_training = threading.Thread(
+            target=self._train_index, args=(self._vectors, self.num_rows, live, self._generation), daemon=True
+        )
+        self._index_training.start()
+
+    def _train_index(self, vectors, num_rows, live, generation):
+        # Rows below num_rows are only rewritten by compaction, which writes
+        # new files, so they can be read without the lock
+        try:
+            trained = self.index.train(vectors, num_rows, live)
+            with self.lock:
+                if self._generation == generation:
+                    self.index.publish(trained, self._vectors, self.num_rows)
+                    print(f"[RAG] Trained the IVF index: {len(trained[0])} lists over {num_rows} rows")
+                # The store may have outgrown these centroids while they
+                # trained, or been compacted, which renumbers the rows
+                self._index_training = None
+                self._maybe_train_index()
+        except Exception as e:
+            print(f"[RAG] Training the IVF index failed: {e}")
+
+    def wait_for_index(self):
+        """Block until IVF training, including any retraining it leads to, has been published."""
+        while True:
+            training = self._index_training
+            if training is None or training is threading.current_thread():
+                return
+            training.join()
+            if self._index_training is training:
+                return
+
+    def count(self) -> int:
+        return int(self._alive[: self.num_rows].sum())
+
+    def add(self, properties, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.quantizer = make_quantizer(self.quantization, self.dim)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO info VALUES ('dim', ?)", (str(self.dim),)
+                )
+            start = self.num_rows
+            end = start + len(vectors)
+            if end > self.capacity:
+                self._grow(end)
+            self._vectors[start:end] = vectors
+            self._vectors.flush()
+            if self._codes is not None:
+                self._codes[start:end] = self.quantizer.encode(vectors)
+                self._codes.flush()
+            if self.index is not None and self.index.trained:
+                self.index.add(start, vectors)
+                self.index.flush()
+            rows = []
+            for row, props in enumerate(properties, start):
+                page_number = props.get("page_number")
+                rows.append((row, props.get("filename"), page_number, json.dumps(props)))
+                self._file_id[row] = self._file_id_for(props.get("filename"))
+                self._page[row] = page_number if page_number is not None else -1
+            self.db.executemany(
+                "INSERT OR REPLACE INTO chunks (row, filename, page_number, properties)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.db.commit()
+            self.bm25.add(start, [props.get("text") for props in properties])
+            # Publish the rows only once vectors and metadata are both written
+            self._alive[start:end] = True
+            self.num_rows = end
+            if self.quantizer and not self.quantizer.trained:
+                self._train_quantizer()
+            if self.index is not None:
+                self._maybe_train_index()
+
+    def delete_file(self, filename: str):
+        with self.lock:
+            self.db.execute("UPDATE chunks SET deleted = 1 WHERE filename = ?", (filename,))
+            self.db.commit()
+            if filename in self.file_ids:
+                file_id = self.file_ids[filename]
+                rows = np.flatnonzero(self._alive[: self.num_rows] & (self._file_id[: self.num_rows] == file_id))
+                self._alive[rows] = False
+                self.bm25.delete(rows.tolist())
+            if self.num_rows - self.count() > COMPACTION_DEAD_RATIO * self.num_rows:
+                self._compact()
+
+    def compact(self):
+        """Rewrite the store without its deleted rows, renumbering the live ones in order."""
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        if self.dim is None:
+            return
+        keep = np.flatnonzero(self._alive[: self.num_rows])
+        num_dead = self.num_rows - len(keep)
+        num_rows = len(keep)
+        capacity = max(num_rows, INITIAL_CAPACITY)
+        self._generation += 1
+        try:
+            # Write the new files next to the old ones; queries keep reading the old
+            moves = [(self.vectors_path + ".tmp", self.vectors_path)]
+            _copy_rows(self._vectors, keep, moves[-1][0], capacity)
+            if self._codes is not None:
+                moves.append((self.codes_path + ".tmp", self.codes_path))
+                _copy_rows(self._codes, keep, moves[-1][0], capacity)
+            if self.index is not None:
+                moves.append((self.index.assignments_path + ".tmp", self.index.assignments_path))
+                self.index.compact(keep, capacity, moves[-1][0])
+            # Renumber the metadata in row order: each row moves down to one
+            # that is already free, so the updates never collide
+            self.db.execute("DELETE FROM chunks WHERE deleted = 1")
+            self.db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                ((new_row, int(row)) for new_row, row in enumerate(keep) if new_row != row),
+            )
+            # Once committed, _load() finishes the moves if we crash before them
+            self.db.execute("INSERT OR REPLACE INTO info VALUES ('compaction', ?)", (json.dumps(moves),))
+            if os.path.exists(self.bm25.path):
+                os.remove(self.bm25.path)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._generation += 1
+            raise
+        for tmp_path, path in moves:
+            os.replace(tmp_path, path)
+        self.db.execute("DELETE FROM info WHERE key = 'compaction'")
+        self.db.commit()
+
+        # Swap in new objects rather than changing the old ones, which
+        # queries that started before the compaction may still be reading
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:num_rows] = True
+        file_id = np.zeros(capacity, dtype=self._file_id.dtype)
+        file_id[:num_rows] = self._file_id[keep]
+        page = np.zeros(capacity, dtype=self._page.dtype)
+        page[:num_rows] = self._page[keep]
+        self._alive, self._file_id, self._page = alive, file_id, page
+        self.capacity = capacity
+        self.num_rows = num_rows
+        if self._codes is not None:
+            self._open_codes()
+        if self.index is not None:
+            self.index.reopen(capacity, num_rows)
+        bm25 = BM25Index(self.dir)
+        for row, properties in self.db.execute("SELECT row, properties FROM chunks ORDER BY row"):
+            bm25.add(row, [json.loads(properties).get("text")])
+        bm25.save()
+        self.bm25 = bm25
+        self._generation += 1
+        print(f"[RAG] Compacted the store: dropped {num_dead} deleted rows, kept {num_rows}")
+
+    def _read(self, search):
+        """Run search() on the rows as of one generation, again if a compaction overlapped it."""
+        while True:
+            generation = self._generation
+            if generation % 2:
+                # Compaction holds the lock until the new rows are in place
+                with self.lock:
+                    continue
+            try:
+                result = search()
+            except Exception:
+                if self._generation == generation:
+                    raise
+                continue
+            if self._generation == generation:
+                return result
+
+    def _mask(self, num_rows, filename=None, page_number=None):
+        mask = self._alive[:num_rows].copy()
+        if filename is not None:
+            if filename not in self.file_ids:
+                return np.zeros(num_rows, dtype=bool)
+            mask &= self._file_id[:num_rows] == self.file_ids[filename]
+        if page_number is not None:
+            mask &= self._page[:num_rows] == page_number
+        return mask
+
+    def query(
+        self,
+        vector,
+        limit: int = 5,
+        filename: str = None,
+        page_number: int = None,
+        nprobe: int = None,
+    ):
+        return self._read(lambda: self._query(vector, limit, filename, page_number, nprobe))
+
+    def _query(self, vector, limit, filename, page_number, nprobe):
+        num_rows = self.num_rows
+        if not num_rows or limit <= 0:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        mask = self._mask(num_rows, filename, page_number)
+
+        # rows is None for a full scan, otherwise the sorted candidate row ids
+        rows = None
+        if self.index is not None and self.index.trained:
+            rows = self.index.candidates(vector, nprobe)
+            rows = rows[rows < num_rows]
+            rows = rows[mask[rows]]
+            num_live = len(rows)
+        else:
+            num_live = int(mask.sum())
+        limit = min(limit, num_live)
+        if not limit:
+            return []
+
+        codes = self._codes
+        if codes is not None:
+            # Coarse scan over the quantized codes, then exact rerank
+            num_candidates = min(max(RERANK_CANDIDATES, limit), num_live)
+            if rows is None:
+                scores = self.quantizer.scores(codes[:num_rows], vector)
+                scores[~mask] = -np.inf
+                candidates = _top(scores, num_candidates)
+            else:
+                scores = self.quantizer.scores(codes[rows], vector)
+                candidates = rows[_top(scores, num_candidates)]
+            candidates.sort()  # sequential reads from the memmap
+            exact = self._vectors[candidates] @ vector
+            top = _top(exact, limit)
+            return self._hits(candidates[top], 1.0 - exact[top])
+
+        if rows is None:
+            scores = self._vectors[:num_rows] @ vector
+            scores[~mask] = -np.inf
+            top = _top(scores, limit)
+            return self._hits(top, 1.0 - scores[top])
+        scores = self._vectors[rows] @ vector
+        top = _top(scores, limit)
+        return self._hits(rows[top], 1.0 - scores[top])
+
+    def keyword_query(self, text: str, limit: int = 5, filename: str = None, page_number: int = None):
+        return self._read(lambda: self._keyword_query(text, limit, filename, page_number))
+
+    def _keyword_query(self, text, limit, filename, page_number):
+        num_rows = self.num_rows
+        if not num_rows or limit <= 0:
+            return []
+        mask = self._mask(num_rows, filename, page_number)
+        scores = self.bm25.scores(text, num_rows, self._alive[:num_rows])
+        scores[~mask] = 0
+        limit = min(limit, int(np.count_nonzero(scores)))
+        if not limit:
+            return []
+        top = _top(scores, limit)
+        return self._hits(top, scores[top], key="score")
+
+    def recorded_embedding_provider(self):
+        row = self.db.execute(
+            "SELECT value FROM info WHERE key = 'embedding_provider'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def record_embedding_provider(self, name: str):
+        self.db.execute("INSERT OR REPLACE INTO info VALUES ('embedding_provider', ?)", (name,))
+        self.db.commit()
+
+    def live_chunks(self):
+        """Return (properties, vectors) for every live row, in row order."""
+        return self._read(self._live_chunks)
+
+    def _live_chunks(self):
+        rows = np.flatnonzero(self._alive[: self.num_rows])
+        properties = dict(
+            self.db.execute("SELECT row, properties FROM chunks WHERE deleted = 0").fetchall()
+        )
+        return [json.loads(properties[int(row)]) for row in rows], np.asarray(self._vectors[rows])
+
+    def memory_usage(self):
+        """Bytes a full scan touches: the float32 matrix, or the codes when quantized."""
+        usage = {"vectors_bytes": self.num_rows * (self.dim or 0) * 4, "codes_bytes": 0}
+        if self._codes is not None:
+            usage["codes_bytes"] = self.num_rows * self.quantizer.code_size
+        return usage
+
+    def _hits(self, rows, values, key="distance"):
+        placeholders = ",".join("?" * len(rows))
+        properties = dict(
+            self.db.execute(
+                f"SELECT row, properties FROM chunks WHERE row IN ({placeholders})",
+                [int(row) for row in rows],
+            ).fetchall()
+        )
+        return [
+            {
+                "id": int(row),
+                "properties": json.loads(properties[int(row)]),
+                key: float(value),
+            }
+            for row, value in zip(rows, values)
+        ]
+
+    def flush(self):
+        with self.lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._codes is not None:
+                self._codes.flush()
+            if self.index is not None:
+                self.index.flush()
+            self.bm25.save()
+
+    def close(self):
+        self.wait_for_index()
+        self.flush()
+        self.db.close()
+
+
+def _copy_rows(source, rows, path, capacity):
+    """Write source[rows] to a new memory-mapped file at path, sized for capacity rows."""
+    target = np.memmap(path, dtype=source.dtype, mode="w+", shape=(capacity,) + source.shape[1:])
+    for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+        block = rows[start : start + SCAN_BLOCK_ROWS]
+        target[start : start + len(block)] = source[block]
+    target.flush()
+    del target
+
+
+def _top(scores, k):
+    """Indices of the k highest scores, best first."""
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def open_store(
+    name: str = "demo",
+    backend: str = VECTOR_STORE_BACKEND,
+    reset: bool = False,
+    embedding_provider: str = None,
+):
+    """
+    Open the named collection on the configured backend (RAG_VECTOR_STORE:
+    "weaviate" or "local"). With reset, any existing data is dropped first.
+
+    The collection keeps the embedding provider it was first opened with;
+    a new collection uses embedding_provider, or RAG_EMBEDDING_PROVIDER
+    when none is given.
+    """
+    store = _open_backend(name, backend, reset)
+    requested = provider_name(embedding_provider or EMBEDDING_PROVIDER)
+    recorded = store.recorded_embedding_provider()
+    if recorded is None and store.count():
+        # Collections filled before providers were recorded hold Voyage vectors
+        recorded = provider_name("voyage")
+        store.record_embedding_provider(recorded)
+    if recorded and embedding_provider and recorded != requested:
+        raise ValueError(
+            f"Collection {name} is embedded with {recorded}, not {requested}; reset it to switch providers"
+        )
+    if recorded is None:
+        store.record_embedding_provider(requested)
+    store.embedder = make_provider(recorded or requested)
+    return store
+
+
+def _open_backend(name, backend, reset):
+    if backend == "local":
+        if reset:
+            import shutil
+
+            shutil.rmtree(os.path.join(LOCAL_STORE_DIR, name), ignore_errors=True)
+        return LocalStore(name)
+    if backend != "weaviate":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    # Import weaviate locally to avoid circular dependency issues
+    import weaviate
+    from weaviate.classes.config import Configure
+
+    client = weaviate.connect_to_local()
+    # Keep the existing collection so unchanged files don't need re-ingesting
+    if reset:
+        try:
+            client.collections.delete(name)
+        except Exception as e:
+            print(f"Could not delete collection (it might not exist yet): {e}")
+    if not client.collections.exists(name):
+        try:
+            client.collections.create(
+                name=name, vectorizer_config=Configure.Vectorizer.none()
+            )
+        except Exception as e:
+            print(f"Error creating collection: {e}")
+    return WeaviateStore(client, client.collections.get(name))
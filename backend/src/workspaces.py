@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from graph import Graph
+from graph_log import GraphLog
+
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "./workspaces")
+DEFAULT_WORKSPACE = "default"
+WORKSPACE_MAX_ACTIVE = int(os.getenv("WORKSPACE_MAX_ACTIVE", 32))  # workspaces kept in memory
+WORKSPACE_MEMORY_BUDGET_MB = float(os.getenv("WORKSPACE_MEMORY_BUDGET_MB", 512))
+WORKSPACE_ID_PATTERN = re.compile(r"[A-Za-z0-9_]{1,64}")
+NODE_OVERHEAD_BYTES = 2048  # rough cost of a node's model objects, indexes and cached JSON
+
+
+class Workspace:
+    """
+    One investigation: its graph, chat history, RAG collection and the
+    store that persists them. users counts the requests, background jobs and
+    change feeds using the workspace; it is never evicted while in use.
+    state is "loading" while its log is replayed, "ready", then "unloading"
+    while it is written to disk on eviction.
+    """
+
+    def __init__(self, workspace_id: str, nodes=None, chat_messages=None, store=None, state: str = "ready"):
+        self.id = workspace_id
+        self.nodes = nodes if nodes is not None else Graph()
+        self.chat_messages = chat_messages if chat_messages is not None else []
+        self.store = store
+        self.rag_collection = None
+        self.users = 0
+        self.state = state
+        self.lock = threading.Lock()  # serializes lazy setup: the root node, the RAG collection
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes held by the workspace's graph and chat history."""
+        return sum(len(node.content) + len(node.name) + NODE_OVERHEAD_BYTES for node in list(self.nodes)) + sum(
+            len(message.message) for message in list(self.chat_messages)
+        )
+
+
+class WorkspaceManager:
+    """
+    Workspaces by id, loaded on first use and kept in least-recently-used
+    order. Each workspace other than the default one is persisted with a
+    GraphLog under dir/<id>/. Whenever a workspace is loaded, idle ones are
+    evicted, least recently used first, until at most max_active are in
+    memory and together they fit memory_budget_mb. An evicted workspace is
+    compacted into a snapshot, so loading it again replays nothing.
+
+    The manager lock only guards the table; loading, sizing and snapshotting
+    happen outside it, and a request for a workspace that is loading or
+    unloading waits for that to finish.
+
+    The default workspace is the server's original graph, persisted as
+    configured in main.py, and always stays in memory.
+    """
+
+    def __init__(
+        self,
+        default: Workspace,
+        dir: str = WORKSPACE_DIR,
+        max_active: int = WORKSPACE_MAX_ACTIVE,
+        memory_budget_mb: float = WORKSPACE_MEMORY_BUDGET_MB,
+    ):
+        self.default = default
+        self.dir = dir
+        self.max_active = max_active
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.workspaces = OrderedDict([(default.id, default)])  # least recently used first
+        self._lock = threading.Lock()
+        self._state_changed = threading.Condition(self._lock)
+
+    def acquire(self, workspace_id: str = DEFAULT_WORKSPACE) -> Workspace:
+        """Get the workspace, loading it if needed, and mark it in use until release()."""
+        if not WORKSPACE_ID_PATTERN.fullmatch(workspace_id):
+            raise ValueError(f"Invalid workspace id: {workspace_id}")
+        with self._lock:
+            while True:
+                workspace = self.workspaces.get(workspace_id)
+                if workspace is None:
+                    break
+                if workspace.state == "ready":
+                    workspace.users += 1
+                    self.workspaces.move_to_end(workspace_id)
+                    return workspace
+                self._state_changed.wait()
+            # Claim the id, then load it without holding up other workspaces
+            workspace = Workspace(workspace_id, state="loading")
+            workspace.users += 1
+            self.workspaces[workspace_id] = workspace
+        try:
+            self._load(workspace)
+        except BaseException:
+            with self._lock:
+                del self.workspaces[workspace_id]
+                self._state_changed.notify_all()
+            raise
+        with self._lock:
+            workspace.state = "ready"
+            self._state_changed.notify_all()
+        try:
+            self._evict()
+        except BaseException:
+            # The caller never gets the workspace, so it must not stay in use
+            self.release(workspace)
+            raise
+        return workspace
+
+    def acquire_by_node(self, node_id: str):
+        """The in-memory workspace holding node_id, marked in use, or None."""
+        with self._lock:
+            for workspace in self.workspaces.values():
+                if workspace.state == "ready" and workspace.nodes.get(node_id) is not None:
+                    workspace.users += 1
+                    return workspace
+        return None
+
+    def release(self, workspace: Workspace):
+        with self._lock:
+            workspace.users -= 1
+
+    def _load(self, workspace):
+        store = GraphLog(workspace.nodes, workspace.chat_messages, dir=os.path.join(self.dir, workspace.id, "graph_log"))
+        store.load()
+        store.start()
+        workspace.store = store
+        print(f"[Workspace] Loaded {workspace.id}")
+
+    def _evict(self):
+        with self._lock:
+            loaded = [workspace for workspace in self.workspaces.values() if workspace.state == "ready"]
+        sizes = {workspace.id: workspace.memory_estimate() for workspace in loaded}
+        evicted = []
+        with self._lock:
+            active = [workspace for workspace in self.workspaces.values() if workspace.state != "unloading"]
+            count = len(active)
+            total = sum(sizes.get(workspace.id, 0) for workspace in active)
+            for workspace in active:
+                if count <= self.max_active and total <= self.memory_budget:
+                    break
+                if workspace is self.default or workspace.users or workspace.state != "ready":
+                    continue
+                workspace.state = "unloading"
+                evicted.append(workspace)
+                count -= 1
+                total -= sizes.get(workspace.id, 0)
+        for workspace in evicted:
+            self._unload(workspace)
+
+    def _unload(self, workspace):
+        try:
+            workspace.store.close(snapshot=True)
+            if workspace.rag_collection is not None:
+                workspace.rag_collection.close()
+            print(f"[Workspace] Evicted {workspace.id}")
+        except Exception as e:
+            # The store has stopped either way; the next acquire reloads from what reached the log
+            print(f"[Workspace] Writing {workspace.id} to disk failed, dropping it from memory: {e}")
+        finally:
+            with self._lock:
+                del self.workspaces[workspace.id]
+                self._state_changed.notify_all()
+
+    def close(self):
+        """Write every loaded workspace to disk, e.g. at shutdown."""
+        with self._lock:
+            while any(workspace.state != "ready" for workspace in self.workspaces.values()):
+                self._state_changed.wait()
+            unloading = [workspace for workspace in self.workspaces.values() if workspace is not self.default]
+            for workspace in unloading:
+                workspace.state = "unloading"
+        for workspace in unloading:
+            self._unload(workspace)
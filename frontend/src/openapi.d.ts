@@ -139,6 +139,8 @@ export interface components {
             mime_type: string;
             /** Size */
             size: number;
+            /** Encoding */
+            encoding?: string | null;
         };
         /** GeneratePayload */
         GeneratePayload: {